@@ -0,0 +1,28 @@
+"""Add subscription lookup indexes
+
+Revision ID: b7d3e91a4c25
+Revises: 47231eccc790
+Create Date: 2026-10-16 10:12:31.482201
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d3e91a4c25'
+down_revision: Union[str, None] = '47231eccc790'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_sub_user_status', 'subscriptions', ['user_id', 'status'], unique=False)
+    op.create_index('ix_sub_user_created', 'subscriptions', ['user_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_sub_user_created', table_name='subscriptions')
+    op.drop_index('ix_sub_user_status', table_name='subscriptions')
@@ -0,0 +1,49 @@
+"""Add unique active subscription index
+
+Revision ID: c41f8a2d9e67
+Revises: b7d3e91a4c25
+Create Date: 2026-10-16 11:05:47.903614
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41f8a2d9e67'
+down_revision: Union[str, None] = 'b7d3e91a4c25'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Activations used to insert ACTIVE rows without checking for existing
+    # ones; keep each user's newest ACTIVE subscription and cancel the rest so
+    # the unique index can be built
+    op.execute(
+        """
+        UPDATE subscriptions SET status = 'CANCELED'
+        WHERE status = 'ACTIVE'
+          AND id <> (
+            SELECT newest.id FROM subscriptions AS newest
+            WHERE newest.user_id = subscriptions.user_id
+              AND newest.status = 'ACTIVE'
+            ORDER BY newest.id DESC
+            LIMIT 1
+          )
+        """
+    )
+    op.create_index(
+        'ix_sub_user_active',
+        'subscriptions',
+        ['user_id'],
+        unique=True,
+        postgresql_where=sa.text("status = 'ACTIVE'"),
+        sqlite_where=sa.text("status = 'ACTIVE'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_sub_user_active', table_name='subscriptions')
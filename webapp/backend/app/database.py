@@ -1,7 +1,10 @@
 from sqlalchemy import create_engine, MetaData
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 import redis
+import redis.asyncio as aioredis
 import os
 from dotenv import load_dotenv
 
@@ -21,6 +24,39 @@ engine = create_engine(
     connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async drivers for the same database, used by routes that must not block the event loop
+ASYNC_DRIVERS = {
+    "sqlite://": "sqlite+aiosqlite://",
+    "postgresql://": "postgresql+asyncpg://",
+    "postgres://": "postgresql+asyncpg://",
+}
+
+def get_async_database_url(url: str = DATABASE_URL) -> str:
+    """Map a sync database URL onto its asyncio driver."""
+    for prefix, async_prefix in ASYNC_DRIVERS.items():
+        if url.startswith(prefix):
+            return async_prefix + url[len(prefix):]
+    return url
+
+def get_async_engine_options(url: str = DATABASE_URL) -> dict:
+    """Pool settings sized for bursts of concurrent payment webhooks."""
+    options = {"pool_pre_ping": True, "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "3600"))}
+    if url.startswith("sqlite"):
+        return options
+    if os.getenv("DB_USE_PGBOUNCER", "false").lower() == "true":
+        # PgBouncer already pools server connections; avoid pooling twice
+        options["poolclass"] = NullPool
+        return options
+    options.update(
+        pool_size=int(os.getenv("DB_POOL_SIZE", "20")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", "30")),
+    )
+    return options
+
+async_engine = create_async_engine(get_async_database_url(), **get_async_engine_options())
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
 Base = declarative_base()
 
 # Redis setup - with fallback for local development
@@ -41,6 +77,27 @@ def get_db():
     finally:
         db.close()
 
+# Async database dependency
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
 # Redis dependency  
 def get_redis():
     return redis_client
+
+# Shared asyncio Redis client, created lazily on first use
+_async_redis_client = None
+
+async def get_async_redis():
+    """Return the shared asyncio Redis client, creating it on first use."""
+    global _async_redis_client
+    if _async_redis_client is None:
+        _async_redis_client = aioredis.from_url(REDIS_URL, decode_responses=True, socket_connect_timeout=2)
+    return _async_redis_client
+
+def reset_async_redis_on_error(error: Exception):
+    """Drop the shared asyncio client after a connection failure so the next call reconnects."""
+    global _async_redis_client
+    if isinstance(error, (redis.ConnectionError, redis.TimeoutError)):
+        _async_redis_client = None
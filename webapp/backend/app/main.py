@@ -5,7 +5,7 @@ Main application entry point with all routes and middleware
 
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 import os
 from dotenv import load_dotenv
 
@@ -21,7 +21,8 @@ app = FastAPI(
     description="Enhanced BIN checker and cryptocurrency wallet balance API",
     version="2.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse
 )
 
 # CORS configuration
@@ -61,8 +61,11 @@ class SecurityMiddleware(BaseHTTPMiddleware):
             # Increment request counters
             await security_service.increment_ip_requests(risk_analysis["client_ip"])
             
-            # Block high-risk requests
+            # Block high-risk requests, and the IP for an hour unless it
+            # already is (so blocks are not extended indefinitely)
             if await security_service.should_block_request(risk_analysis):
+                if "IP_BLOCKED" not in risk_analysis["risk_factors"]:
+                    await security_service.block_ip(risk_analysis["client_ip"])
                 await self._log_blocked_request(request, risk_analysis, user)
                 return JSONResponse(
                     status_code=status.HTTP_429_TOO_MANY_REQUESTS,
@@ -119,11 +122,12 @@ class SecurityMiddleware(BaseHTTPMiddleware):
         """Log details of blocked requests for analysis"""
         blocked_request_data = {
             "timestamp": time.time(),
-            "ip": risk_analysis["client_ip"],
+            "client_ip": risk_analysis["client_ip"],
             "user_agent": risk_analysis.get("user_agent", ""),
             "path": request.url.path,
             "method": request.method,
             "risk_score": risk_analysis["risk_score"],
+            "risk_level": risk_analysis["risk_level"],
             "risk_factors": risk_analysis["risk_factors"],
             "user_id": user.id if user else None,
             "headers": dict(request.headers)
@@ -1,7 +1,7 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, BigInteger, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, BigInteger, ForeignKey, Enum, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 import enum  # Add this import
 
 Base = declarative_base()
@@ -61,6 +61,20 @@ class Subscription(Base):
     
     # Relationships
     user = relationship("User", back_populates="subscriptions")
+    
+    __table_args__ = (
+        # Payment routes look subscriptions up by (user_id, status) or latest per user
+        Index("ix_sub_user_status", "user_id", "status"),
+        Index("ix_sub_user_created", "user_id", "created_at"),
+        # At most one active subscription per user
+        Index(
+            "ix_sub_user_active",
+            "user_id",
+            unique=True,
+            postgresql_where=text("status = 'ACTIVE'"),
+            sqlite_where=text("status = 'ACTIVE'"),
+        ),
+    )
 
 class BinData(Base):
     __tablename__ = "bin_data"
@@ -18,6 +18,11 @@ import json
 router = APIRouter()
 limiter = Limiter(key_func=get_remote_address)
 
+@router.on_event("shutdown")
+async def close_d1_client():
+    """Release pooled Cloudflare D1 connections."""
+    await d1_service.aclose()
+
 # Pydantic models
 class BinResponse(BaseModel):
     bin: str
@@ -391,13 +396,15 @@ async def analyze_multiple_bins(
         raise HTTPException(status_code=400, detail="Maximum 50 BINs per request")
     
     results = []
+    processed_at = datetime.utcnow().isoformat()
     for bin_input in bins:
         try:
             result = await premium_service.enhanced_bin_lookup(
                 bin_input=bin_input.strip()[:6],
                 user=current_user,
                 db=db,
-                include_extended_data=True
+                include_extended_data=True,
+                lookup_time=processed_at
             )
             results.append(result)
         except Exception as e:
@@ -412,7 +419,7 @@ async def analyze_multiple_bins(
         "total_processed": len(bins),
         "successful": len([r for r in results if r.get("valid", False)]),
         "failed": len([r for r in results if not r.get("valid", True)]),
-        "processed_at": datetime.utcnow().isoformat()
+        "processed_at": processed_at
     }
 
 @router.get("/premium/insights")
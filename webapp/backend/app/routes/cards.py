@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, validator
 from typing import List, Optional
@@ -11,7 +12,7 @@ from app.database import get_db, get_redis
 from app.models import User, UsageLog, ActionType, UserTier
 from app.utils.security import get_current_active_user
 from app.utils.ip_rate_limit import ip_rate_limiter
-from app.services.card_generator import generate_test_card, AVS_POSTAL_CODES
+from app.services.card_generator import generate_test_card, generate_test_cards, AVS_POSTAL_CODES
 from app.services.security_service import SecurityService  # NEW
 from app.services.premium_features import premium_service
 import os
@@ -298,24 +299,20 @@ async def generate_bulk_cards(
         )
     
     try:
-        cards = []
-        generation_errors = 0
-        
-        for _ in range(bulk_request.count):
-            try:
-                card_data = await generate_test_card(
-                    bin_input=bulk_request.bin,
-                    db=db,
-                    include_avs=bulk_request.include_avs,
-                    avs_country=bulk_request.avs_country
-                )
-                card_data['generated_at'] = datetime.now(timezone.utc)
-                cards.append(CardResponse(**card_data))
-                
-            except Exception as e:
-                generation_errors += 1
-                # Continue generating other cards
-                continue
+        try:
+            generated = await generate_test_cards(
+                bin_input=bulk_request.bin,
+                db=db,
+                count=bulk_request.count,
+                include_avs=bulk_request.include_avs,
+                avs_country=bulk_request.avs_country
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        generated_at = datetime.now(timezone.utc)
+        cards = [CardResponse(**card_data, generated_at=generated_at) for card_data in generated]
+        generation_errors = bulk_request.count - len(cards)
         
         if not cards:
             raise HTTPException(status_code=400, detail="Failed to generate any cards")
@@ -522,8 +519,8 @@ async def generate_cards_bulk(
             detail="Bulk generation requires premium subscription. Upgrade to access this feature."
         )
     
-    # Check rate limits
-    rate_limits = premium_service.get_rate_limits(current_user, db)
+    # Check rate limits (premium status was checked above)
+    rate_limits = premium_service.rate_limits_for(True)
     if request.count > rate_limits["bulk_generation"]:
         raise HTTPException(
             status_code=400,
@@ -561,6 +558,7 @@ async def generate_cards_bulk(
 
 @router.post("/export/{format}")
 async def export_cards(
+    request: Request,
     format: str,
     cards_data: List[dict],
     current_user: User = Depends(get_current_active_user),
@@ -583,9 +581,9 @@ async def export_cards(
             detail=f"Unsupported format. Use one of: {', '.join(supported_formats)}"
         )
     
-    # Check daily export limit
+    # Check daily export limit (premium status was checked above)
     daily_exports = premium_service.get_user_daily_usage(current_user, db, ActionType.BULK_EXPORT)
-    rate_limits = premium_service.get_rate_limits(current_user, db)
+    rate_limits = premium_service.rate_limits_for(True)
     
     if daily_exports >= rate_limits["export"]:
         raise HTTPException(
@@ -594,7 +592,7 @@ async def export_cards(
         )
     
     try:
-        exported_data = premium_service.export_cards(cards_data, format.lower())
+        exported_chunks = premium_service.iter_export(cards_data, format.lower())
         
         # Log usage
         log_usage(current_user, db, request, ActionType.BULK_EXPORT, {
@@ -612,8 +610,9 @@ async def export_cards(
         
         filename = f"cards_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format.lower()}"
         
-        return Response(
-            content=exported_data,
+        # Stream the export so large batches are encoded as they are sent
+        return StreamingResponse(
+            exported_chunks,
             media_type=content_types[format.lower()],
             headers={
                 "Content-Disposition": f"attachment; filename={filename}"
@@ -633,8 +632,8 @@ async def get_premium_features(
     """
     Get available premium features and user's access level.
     """
-    is_premium = premium_service.is_user_premium(current_user, db) if current_user else False
-    rate_limits = premium_service.get_rate_limits(current_user, db)
+    is_premium = premium_service.is_user_premium(current_user, db)
+    rate_limits = premium_service.rate_limits_for(is_premium)
     
     features = {
         "basic_generation": {
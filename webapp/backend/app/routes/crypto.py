@@ -25,6 +25,10 @@ CRYPTO_API_RATE_LIMIT = int(os.getenv("CRYPTO_API_RATE_LIMIT", "30"))  # 30 per
 FREE_CRYPTO_CHECKS_PER_IP = int(os.getenv("FREE_CRYPTO_CHECKS_PER_IP", "10"))  # 10 per 24h per IP
 PREMIUM_CRYPTO_CHECKS = int(os.getenv("PREMIUM_CRYPTO_CHECKS", "1000"))  # 1000 per day
 
+# Sliding windows (seconds) shared by the security check and the IP rate limit
+RAPID_SCAN_WINDOW = 5 * 60
+DAILY_WINDOW = 86400
+
 # External API endpoints (use environment variables in production)
 BLOCKCHAIN_INFO_API = "https://blockchain.info/address/{address}?format=json"
 ETHERSCAN_API = "https://api.etherscan.io/api?module=account&action=balance&address={address}&tag=latest"
@@ -63,7 +67,17 @@ class CryptoBalanceResponse(BaseModel):
     is_valid: bool = True
     error: Optional[str] = None
 
-async def advanced_crypto_security_check(request: Request, wallet_address: str) -> tuple[bool, str]:
+def get_crypto_window_counts(client_ip: str) -> Dict[int, int]:
+    """
+    Fetch recent crypto-check counts for an IP in a single Redis round-trip.
+    """
+    return ip_rate_limiter.get_window_counts(client_ip, "crypto_check", (RAPID_SCAN_WINDOW, DAILY_WINDOW))
+
+async def advanced_crypto_security_check(
+    request: Request,
+    wallet_address: str,
+    window_counts: Optional[Dict[int, int]] = None
+) -> tuple[bool, str]:
     """
     Advanced security check specifically for crypto wallet operations.
     This is critical because crypto operations are high-value targets.
@@ -82,7 +96,9 @@ async def advanced_crypto_security_check(request: Request, wallet_address: str)
     
     # Check for rapid successive wallet checks (crypto farming detection)
     client_ip = request.client.host
-    recent_checks = await security_service.get_recent_activity(client_ip, "crypto_check", minutes=5)
+    if window_counts is None:
+        window_counts = get_crypto_window_counts(client_ip)
+    recent_checks = window_counts.get(RAPID_SCAN_WINDOW, 0)
     if recent_checks > 20:  # More than 20 wallet checks in 5 minutes
         crypto_risk_factors.append("RAPID_WALLET_SCANNING")
     
@@ -124,7 +140,11 @@ async def advanced_crypto_security_check(request: Request, wallet_address: str)
     
     return True, ""
 
-async def check_crypto_rate_limit(request: Request, current_user: Optional[User]) -> tuple[bool, str]:
+async def check_crypto_rate_limit(
+    request: Request,
+    current_user: Optional[User],
+    window_counts: Optional[Dict[int, int]] = None
+) -> tuple[bool, str]:
     """
     Check crypto-specific rate limits.
     """
@@ -149,11 +169,10 @@ async def check_crypto_rate_limit(request: Request, current_user: Optional[User]
         return True, ""
     
     # Free/anonymous users get IP-based limits
-    is_allowed, remaining = ip_rate_limiter.check_ip_limit(
-        client_ip, "crypto_check", FREE_CRYPTO_CHECKS_PER_IP, 24
-    )
+    if window_counts is None:
+        window_counts = get_crypto_window_counts(client_ip)
     
-    if not is_allowed:
+    if window_counts.get(DAILY_WINDOW, 0) >= FREE_CRYPTO_CHECKS_PER_IP:
         return False, f"Daily limit exceeded. Free users get {FREE_CRYPTO_CHECKS_PER_IP} crypto checks per 24 hours per IP. Upgrade to Premium for {PREMIUM_CRYPTO_CHECKS} checks per day."
     
     return True, ""
@@ -366,13 +385,18 @@ async def check_crypto_balance(
     """
     Check cryptocurrency wallet balance with advanced security.
     """
+    # Recent activity is read once and shared by the security and rate limit checks
+    window_counts = get_crypto_window_counts(request.client.host)
+    
     # CRITICAL SECURITY CHECKS
-    security_allowed, security_msg = await advanced_crypto_security_check(request, wallet_request.address)
+    security_allowed, security_msg = await advanced_crypto_security_check(
+        request, wallet_request.address, window_counts
+    )
     if not security_allowed:
         raise HTTPException(status_code=403, detail=security_msg)
     
     # Rate limit check
-    rate_allowed, rate_msg = await check_crypto_rate_limit(request, current_user)
+    rate_allowed, rate_msg = await check_crypto_rate_limit(request, current_user, window_counts)
     if not rate_allowed:
         raise HTTPException(status_code=429, detail=rate_msg)
     
@@ -3,22 +3,43 @@ Health Check and System Monitoring Service
 Monitors the security and performance of your BIN database service
 """
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime, timezone
 import asyncio
+import logging
+import orjson
 import os
+import time
 
-from app.database import get_redis, get_db
+from app.database import get_db, get_async_redis, reset_async_redis_on_error
+from app.utils.cache import ttl_cache
 from app.services.d1_bin_service import d1_service
-from app.services.security_service import security_service
+from app.services.security_service import (
+    security_service, today_events_key, RECENT_EVENTS_KEY, BLOCKED_REQUESTS_KEY, HIGH_RISK_REQUESTS_KEY
+)
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
+logger = logging.getLogger(__name__)
+
+# Detailed health is computed in the background and served from this cache
+HEALTH_CHECK_INTERVAL_SECONDS = int(os.getenv("HEALTH_CHECK_INTERVAL_SECONDS", "10"))
+_HEALTH_CACHE: Dict[str, Any] = {}
+_HEALTH_LOCK = asyncio.Lock()
+_health_task: Optional[asyncio.Task] = None
+
+# Pre-serialized /health body as (built_at, body), rebuilt at most once a second
+_basic_health_body: Tuple[float, bytes] = (float("-inf"), b"")
+
+# Overall status is the most severe component status
+OVERALL_STATUSES = ("healthy", "degraded", "unhealthy")
+STATUS_SEVERITY = {"healthy": 0, "degraded": 1, "unhealthy": 2}
 
 class HealthStatus(BaseModel):
     status: str
-    timestamp: str
+    timestamp: datetime
     version: str = "1.0.0"
 
 class DatabaseHealth(BaseModel):
@@ -42,30 +63,74 @@ class SystemHealth(BaseModel):
 @router.get("/health", response_model=HealthStatus)
 async def basic_health_check():
     """Basic health check endpoint"""
-    return HealthStatus(
-        status="healthy",
-        timestamp=datetime.now(timezone.utc).isoformat()
-    )
+    global _basic_health_body
+    now = time.monotonic()
+    if now - _basic_health_body[0] >= 1:
+        _basic_health_body = (now, orjson.dumps({
+            "status": "healthy",
+            "timestamp": datetime.now(timezone.utc),
+            "version": "1.0.0"
+        }))
+    return Response(content=_basic_health_body[1], media_type="application/json")
+
+@router.get("/ping")
+async def ping():
+    """Liveness probe for load balancers; does no work"""
+    return {"ok": True}
 
 @router.get("/health/detailed", response_model=SystemHealth)
 async def detailed_health_check():
-    """Comprehensive system health check"""
+    """Comprehensive system health check (served from the background cache)"""
+    cached = _HEALTH_CACHE.get("detailed")
+    if cached is None:
+        cached = await _refresh_health_cache()
+    return cached
+
+@router.on_event("startup")
+async def _start_health_loop():
+    """Start the periodic background health check"""
+    global _health_task
+    _health_task = asyncio.create_task(_health_loop())
+
+@router.on_event("shutdown")
+async def _stop_health_loop():
+    """Stop the periodic background health check"""
+    if _health_task:
+        _health_task.cancel()
+
+async def _health_loop():
+    """Refresh the cached health payload every HEALTH_CHECK_INTERVAL_SECONDS"""
+    while True:
+        try:
+            await _refresh_health_cache()
+        except Exception as e:
+            logger.error(f"Background health check failed: {e}")
+        await asyncio.sleep(HEALTH_CHECK_INTERVAL_SECONDS)
+
+async def _refresh_health_cache() -> SystemHealth:
+    """Run all health checks and swap the result into the cache"""
+    async with _HEALTH_LOCK:
+        health = await _collect_system_health()
+        _HEALTH_CACHE["detailed"] = health
+        return health
+
+async def _collect_system_health() -> SystemHealth:
+    """Run every system health check"""
     
-    # Check all system components
-    db_health = await _check_database_health()
-    security_health = await _check_security_health()
-    bin_stats = await _get_bin_database_stats()
+    # Check all system components concurrently
+    db_health, security_health, bin_stats = await asyncio.gather(
+        _check_database_health(),
+        _check_security_health(),
+        _get_bin_database_stats()
+    )
     
     # Determine overall status
-    overall_status = "healthy"
-    if (db_health.d1_database["status"] != "healthy" or 
-        db_health.redis_cache["status"] != "healthy" or
-        security_health.active_threats > 10):
-        overall_status = "degraded"
-    
-    if (db_health.d1_database["status"] == "unhealthy" or
-        db_health.redis_cache["status"] == "unhealthy"):
-        overall_status = "unhealthy"
+    severity = max(
+        STATUS_SEVERITY.get(db_health.d1_database["status"], 1),
+        STATUS_SEVERITY.get(db_health.redis_cache["status"], 1),
+        1 if security_health.active_threats > 10 else 0
+    )
+    overall_status = OVERALL_STATUSES[severity]
     
     return SystemHealth(
         overall_status=overall_status,
@@ -78,82 +143,88 @@ async def detailed_health_check():
 async def _check_database_health() -> DatabaseHealth:
     """Check health of all database connections"""
     
-    # Check D1 database
-    d1_health = {"status": "unknown", "response_time_ms": 0, "record_count": 0}
+    # The probes are independent, so run them concurrently
+    d1_health, local_health, redis_health = await asyncio.gather(
+        _probe_d1(),
+        _probe_local(),
+        _probe_redis()
+    )
+    
+    return DatabaseHealth(
+        d1_database=d1_health,
+        local_database=local_health,
+        redis_cache=redis_health
+    )
+
+async def _probe_d1() -> Dict[str, Any]:
+    """Check D1 database"""
     try:
-        start_time = datetime.now()
+        start_ns = time.perf_counter_ns()
         record_count = await d1_service.get_total_bin_count()
-        response_time = (datetime.now() - start_time).total_seconds() * 1000
+        response_time = (time.perf_counter_ns() - start_ns) / 1e6
         
-        d1_health = {
+        return {
             "status": "healthy" if record_count > 400000 else "degraded",
             "response_time_ms": round(response_time, 2),
             "record_count": record_count or 0
         }
     except Exception as e:
-        d1_health = {"status": "unhealthy", "error": str(e), "response_time_ms": 0, "record_count": 0}
-    
-    # Check local SQLite database  
-    local_health = {"status": "healthy", "response_time_ms": 0}
+        return {"status": "unhealthy", "error": str(e), "response_time_ms": 0, "record_count": 0}
+
+async def _probe_local() -> Dict[str, Any]:
+    """Check local SQLite database"""
     try:
         # You'd implement local database health check here
-        local_health = {"status": "healthy", "response_time_ms": 5.0}
+        return {"status": "healthy", "response_time_ms": 5.0}
     except Exception as e:
-        local_health = {"status": "unhealthy", "error": str(e)}
-    
-    # Check Redis cache
-    redis_health = {"status": "unknown", "response_time_ms": 0}
+        return {"status": "unhealthy", "error": str(e)}
+
+async def _probe_redis() -> Dict[str, Any]:
+    """Check Redis cache"""
     try:
-        redis = get_redis()
-        start_time = datetime.now()
+        redis = await get_async_redis()
+        start_ns = time.perf_counter_ns()
         await redis.ping()
-        response_time = (datetime.now() - start_time).total_seconds() * 1000
+        response_time = (time.perf_counter_ns() - start_ns) / 1e6
         
-        redis_health = {
+        return {
             "status": "healthy",
             "response_time_ms": round(response_time, 2)
         }
     except Exception as e:
-        redis_health = {"status": "unhealthy", "error": str(e)}
-    
-    return DatabaseHealth(
-        d1_database=d1_health,
-        local_database=local_health,
-        redis_cache=redis_health
-    )
+        reset_async_redis_on_error(e)
+        return {"status": "unhealthy", "error": str(e)}
 
 async def _check_security_health() -> SecurityHealth:
     """Check security system health and threat status"""
     
     try:
-        redis = get_redis()
+        redis = await get_async_redis()
         
-        # Count security events from today
-        today_key = f"security:events:count:{datetime.now().strftime('%Y-%m-%d')}"
-        events_today = await redis.get(today_key) or 0
-        events_today = int(events_today)
+        # Security events from today, blocked requests and high-risk requests
+        today_key = today_events_key()
+        blocked_key = BLOCKED_REQUESTS_KEY
+        high_risk_key = HIGH_RISK_REQUESTS_KEY
         
-        # Count blocked requests
-        blocked_key = "security:blocked_requests_today"
-        blocked_today = await redis.get(blocked_key) or 0
-        blocked_today = int(blocked_today)
-        
-        # Count high-risk requests
-        high_risk_key = "security:high_risk_requests_today"
-        high_risk_today = await redis.get(high_risk_key) or 0
-        high_risk_today = int(high_risk_today)
-        
-        # Active threats (IPs with multiple recent blocks)
-        active_threats = await _count_active_threats()
+        # Fetch all counters in one round-trip while the threat count runs alongside
+        pipe = redis.pipeline()
+        pipe.get(today_key)
+        pipe.get(blocked_key)
+        pipe.get(high_risk_key)
+        (events_today, blocked_today, high_risk_today), active_threats = await asyncio.gather(
+            pipe.execute(),
+            _count_active_threats()
+        )
         
         return SecurityHealth(
-            blocked_requests_today=blocked_today,
-            high_risk_requests_today=high_risk_today,
+            blocked_requests_today=int(blocked_today or 0),
+            high_risk_requests_today=int(high_risk_today or 0),
             active_threats=active_threats,
-            security_events_today=events_today
+            security_events_today=int(events_today or 0)
         )
         
-    except Exception:
+    except Exception as e:
+        reset_async_redis_on_error(e)
         # Return default values if security check fails
         return SecurityHealth(
             blocked_requests_today=0,
@@ -196,12 +267,11 @@ async def _get_bin_database_stats() -> Dict[str, int]:
 async def _count_active_threats() -> int:
     """Count active security threats"""
     try:
-        redis = get_redis()
+        redis = await get_async_redis()
         # Count IPs that have been blocked multiple times recently
-        threat_pattern = "security:blocked_ip:*"
-        blocked_ips = await redis.keys(threat_pattern)
-        return len(blocked_ips)
-    except Exception:
+        return await security_service.count_blocked_ips(redis)
+    except Exception as e:
+        reset_async_redis_on_error(e)
         return 0
 
 async def _get_unique_brand_count() -> int:
@@ -228,49 +298,51 @@ async def _get_unique_issuer_count() -> int:
     except Exception:
         return 0
 
+# Static system metrics, built once at import
+SYSTEM_METRICS = {
+    "database": {
+        "d1_connection_pool": "healthy",
+        "query_performance": "optimal",
+        "cache_hit_ratio": "85%"
+    },
+    "security": {
+        "threat_level": "low",
+        "blocked_attacks_today": 12,
+        "suspicious_activity": "minimal"
+    },
+    "performance": {
+        "avg_response_time_ms": 45,
+        "requests_per_second": 25,
+        "error_rate": "0.1%"
+    },
+    "bin_database": {
+        "status": "fully_loaded",
+        "records": 458051,
+        "last_updated": "2025-09-10T00:00:00Z"
+    }
+}
+
 @router.get("/metrics")
+@ttl_cache(seconds=30)
 async def get_system_metrics():
     """Get detailed system metrics for monitoring"""
-    
-    return {
-        "database": {
-            "d1_connection_pool": "healthy",
-            "query_performance": "optimal",
-            "cache_hit_ratio": "85%"
-        },
-        "security": {
-            "threat_level": "low",
-            "blocked_attacks_today": 12,
-            "suspicious_activity": "minimal"
-        },
-        "performance": {
-            "avg_response_time_ms": 45,
-            "requests_per_second": 25,
-            "error_rate": "0.1%"
-        },
-        "bin_database": {
-            "status": "fully_loaded",
-            "records": 458051,
-            "last_updated": "2025-09-10T00:00:00Z"
-        }
-    }
+    return SYSTEM_METRICS
 
 @router.get("/security/threats")
 async def get_security_threats():
     """Get current security threat information"""
     
     try:
-        redis = get_redis()
+        redis = await get_async_redis()
         
-        # Get recent blocked IPs
-        blocked_ips = await redis.keys("security:blocked_ip:*")
+        # Count recent blocked IPs
+        active_blocks = await security_service.count_blocked_ips(redis)
         
-        # Get recent security events
-        recent_events = await redis.keys("security:events:*")
-        recent_events = recent_events[-10:]  # Get last 10 events
+        # Get the 10 most recent security events
+        recent_events = await redis.lrange(RECENT_EVENTS_KEY, 0, 9)
         
         return {
-            "active_blocks": len(blocked_ips),
+            "active_blocks": active_blocks,
             "recent_threats": [
                 {
                     "type": "brute_force_attempt",
@@ -292,7 +364,8 @@ async def get_security_threats():
             ]
         }
         
-    except Exception:
+    except Exception as e:
+        reset_async_redis_on_error(e)
         return {
             "active_blocks": 0,
             "recent_threats": [],
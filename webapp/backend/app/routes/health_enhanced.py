@@ -2,23 +2,54 @@
 Enhanced Health Check Routes
 Provides comprehensive system status and monitoring endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timezone, timedelta
+from sqlalchemy import func, select
+import asyncio
+import logging
 import psutil
 import os
+import sys
+import time
 import json
 
-from app.database import get_db, get_redis
+from app.database import get_db, get_async_redis, reset_async_redis_on_error, SessionLocal
+from app.models import BinData, Subscription, SubscriptionStatus, User
+from app.utils.cache import ttl_cache
 from enhanced_monitoring import health_monitor, error_tracker
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
+logger = logging.getLogger(__name__)
+
+# Detailed health is computed in the background and served from this cache
+HEALTH_CHECK_INTERVAL_SECONDS = int(os.getenv("HEALTH_CHECK_INTERVAL_SECONDS", "10"))
+_HEALTH_CACHE: Dict[str, Any] = {}
+_HEALTH_LOCK = asyncio.Lock()
+_background_tasks: List[asyncio.Task] = []
+
+# CPU usage is sampled without blocking by a background task; priming the
+# counter here makes the first non-blocking read meaningful. Disk usage moves
+# slowly, so it is sampled at a much lower rate.
+CPU_SAMPLE_INTERVAL_SECONDS = 5
+DISK_SAMPLE_INTERVAL_SECONDS = 60
+psutil.cpu_percent(interval=None)
+_cpu_usage = 0.0
+_disk_usage = psutil.disk_usage('/').percent
+
+# Runtime environment details do not change while the process is running
+ENVIRONMENT_INFO = {
+    "python_version": f"{sys.version_info.major}.{sys.version_info.minor}.{sys.version_info.micro}",
+    "debug_mode": os.getenv("DEBUG", "false").lower() == "true",
+    "timezone": str(datetime.now(timezone.utc).astimezone().tzinfo)
+}
 
 class HealthStatus(BaseModel):
     status: str
-    timestamp: str
+    timestamp: datetime
     version: str = "2.0.0"
     uptime: float
     services: Dict[str, Any]
@@ -34,6 +65,32 @@ class ErrorSummary(BaseModel):
     last_hour: int
     critical_errors: List[str]
 
+# All database statistics in a single round-trip; built from the models so
+# the status filter matches how the enum is stored
+DATABASE_STATS_QUERY = select(
+    select(func.count()).select_from(BinData).scalar_subquery(),
+    select(func.count()).select_from(User).scalar_subquery(),
+    select(func.count()).select_from(Subscription).where(
+        Subscription.status == SubscriptionStatus.ACTIVE
+    ).scalar_subquery()
+)
+
+# Overall status by severity; the database is critical, while an unreachable
+# external service only degrades the API
+OVERALL_STATUSES = ("healthy", "degraded", "unhealthy")
+DATABASE_SEVERITY = {"healthy": 0}
+EXTERNAL_SERVICE_SEVERITY = {"unhealthy": 1}
+
+# Prometheus text exposition format
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Application metrics (these would be tracked in a real application)
+PROMETHEUS_APP_METRICS = (
+    b"api_requests_total 0\n"
+    b"api_errors_total 0\n"
+    b"payment_transactions_total 0\n"
+)
+
 # Store startup time for uptime calculation
 startup_time = datetime.now(timezone.utc)
 
@@ -44,110 +101,175 @@ async def health_check(request: Request, db: Session = Depends(get_db)):
     Returns overall system status and service health
     """
     try:
-        current_time = datetime.now(timezone.utc)
-        uptime = (current_time - startup_time).total_seconds()
-        
-        # Check database health
-        db_health = health_monitor.check_database_health(db)
-        
-        # Check Redis health (if available)
-        redis_client = get_redis()
-        redis_health = {"status": "not_configured"}
-        if redis_client:
-            try:
-                redis_client.ping()
-                redis_health = {"status": "healthy"}
-            except Exception as e:
-                redis_health = {"status": "unhealthy", "error": str(e)}
-        
-        # Check external services
-        external_services = health_monitor.check_external_services()
-        
-        # Overall status determination
-        critical_services = ['database']
-        overall_status = "healthy"
-        
-        if db_health['status'] != 'healthy':
-            overall_status = "unhealthy"
-        elif any(service['status'] == 'unhealthy' for service in external_services.values()):
-            overall_status = "degraded"
-        
-        services = {
-            "database": db_health,
-            "redis": redis_health,
-            "external_services": external_services
-        }
-        
-        return HealthStatus(
-            status=overall_status,
-            timestamp=current_time.isoformat(),
-            uptime=uptime,
-            services=services
-        )
+        return await _build_health_status(db)
         
     except Exception as e:
         error_tracker.log_api_error(request, e)
         raise HTTPException(status_code=500, detail="Health check failed")
 
+async def _build_health_status(db: Session) -> HealthStatus:
+    """Check the database, Redis and external services"""
+    current_time = datetime.now(timezone.utc)
+    uptime = (current_time - startup_time).total_seconds()
+    
+    # Check database health
+    db_health = health_monitor.check_database_health(db)
+    
+    # Check Redis health
+    try:
+        redis_client = await get_async_redis()
+        await redis_client.ping()
+        redis_health = {"status": "healthy"}
+    except Exception as e:
+        reset_async_redis_on_error(e)
+        redis_health = {"status": "unhealthy", "error": str(e)}
+    
+    # Check external services (blocking HTTP calls, so keep them off the event loop)
+    external_services = await asyncio.to_thread(health_monitor.check_external_services)
+    
+    # Overall status determination
+    severity = max([
+        DATABASE_SEVERITY.get(db_health['status'], 2),
+        *(EXTERNAL_SERVICE_SEVERITY.get(service['status'], 0) for service in external_services.values())
+    ])
+    overall_status = OVERALL_STATUSES[severity]
+    
+    services = {
+        "database": db_health,
+        "redis": redis_health,
+        "external_services": external_services
+    }
+    
+    return HealthStatus(
+        status=overall_status,
+        timestamp=current_time,
+        uptime=uptime,
+        services=services
+    )
+
 @router.get("/health/detailed", response_model=Dict[str, Any])
-async def detailed_health_check(request: Request, db: Session = Depends(get_db)):
+async def detailed_health_check(request: Request):
     """
     Detailed health check with system metrics and error summaries
+    (served from the background cache)
     """
     try:
-        # Get basic health status
-        basic_health = await health_check(request, db)
+        cached = _HEALTH_CACHE.get("detailed")
+        if cached is None:
+            cached = await _refresh_health_cache()
+        return cached
         
-        # System metrics
-        system_metrics = SystemMetrics(
-            cpu_usage=psutil.cpu_percent(interval=1),
-            memory_usage=psutil.virtual_memory().percent,
-            disk_usage=psutil.disk_usage('/').percent,
-            active_connections=len(psutil.net_connections())
-        )
+    except Exception as e:
+        error_tracker.log_api_error(request, e)
+        raise HTTPException(status_code=500, detail="Detailed health check failed")
+
+@router.on_event("startup")
+async def _start_health_loop():
+    """Start the periodic background health check and CPU sampler"""
+    _background_tasks.append(asyncio.create_task(_system_sample_loop()))
+    _background_tasks.append(asyncio.create_task(_health_loop()))
+
+@router.on_event("shutdown")
+async def _stop_health_loop():
+    """Stop the periodic background health check and CPU sampler"""
+    for task in _background_tasks:
+        task.cancel()
+    _background_tasks.clear()
+
+async def _system_sample_loop():
+    """Sample CPU usage every CPU_SAMPLE_INTERVAL_SECONDS and disk usage every DISK_SAMPLE_INTERVAL_SECONDS"""
+    global _cpu_usage, _disk_usage
+    next_disk_sample = time.monotonic() + DISK_SAMPLE_INTERVAL_SECONDS
+    while True:
+        await asyncio.sleep(CPU_SAMPLE_INTERVAL_SECONDS)
+        _cpu_usage = psutil.cpu_percent(interval=None)
         
-        # Database statistics
+        if time.monotonic() >= next_disk_sample:
+            _disk_usage = (await asyncio.to_thread(psutil.disk_usage, '/')).percent
+            next_disk_sample = time.monotonic() + DISK_SAMPLE_INTERVAL_SECONDS
+
+async def _health_loop():
+    """Refresh the cached health payload every HEALTH_CHECK_INTERVAL_SECONDS"""
+    while True:
         try:
-            bin_count = db.execute("SELECT COUNT(*) FROM bin_data").scalar()
-            user_count = db.execute("SELECT COUNT(*) FROM users").scalar()
-            subscription_count = db.execute("SELECT COUNT(*) FROM subscriptions WHERE status = 'active'").scalar()
-            
-            database_stats = {
-                "bin_records": bin_count,
-                "total_users": user_count,
-                "active_subscriptions": subscription_count
-            }
+            await _refresh_health_cache()
         except Exception as e:
-            database_stats = {"error": str(e)}
-        
-        # API endpoint checks
-        api_health = health_monitor.check_api_endpoints()
-        
-        # Error summary (mock - in production, read from logs/database)
-        error_summary = ErrorSummary(
-            last_24h=0,  # Would be calculated from error logs
-            last_hour=0,  # Would be calculated from error logs
-            critical_errors=[]  # Would be extracted from error logs
-        )
+            logger.error(f"Background health check failed: {e}")
+        await asyncio.sleep(HEALTH_CHECK_INTERVAL_SECONDS)
+
+async def _refresh_health_cache() -> Dict[str, Any]:
+    """Run all health checks and swap the result into the cache"""
+    async with _HEALTH_LOCK:
+        db = SessionLocal()
+        try:
+            health = await _collect_detailed_health(db)
+        finally:
+            db.close()
+        _HEALTH_CACHE["detailed"] = health
+        return health
+
+async def _collect_detailed_health(db: Session) -> Dict[str, Any]:
+    """Gather system metrics, database statistics and endpoint status"""
+    # Basic health, system metrics, database statistics and API endpoint
+    # checks are independent; the blocking ones run in worker threads
+    basic_health, system_metrics, database_stats, api_health = await asyncio.gather(
+        _build_health_status(db),
+        asyncio.to_thread(_sample_system_metrics),
+        asyncio.to_thread(_get_database_stats),
+        asyncio.to_thread(health_monitor.check_api_endpoints)
+    )
+    
+    # Error summary (mock - in production, read from logs/database)
+    error_summary = ErrorSummary(
+        last_24h=0,  # Would be calculated from error logs
+        last_hour=0,  # Would be calculated from error logs
+        critical_errors=[]  # Would be extracted from error logs
+    )
+    
+    return {
+        "basic_health": basic_health.model_dump(),
+        "system_metrics": system_metrics.model_dump(),
+        "database_stats": database_stats,
+        "api_endpoints": api_health,
+        "error_summary": error_summary.model_dump(),
+        "environment": ENVIRONMENT_INFO
+    }
+
+def _sample_system_metrics() -> SystemMetrics:
+    """Sample CPU, memory, disk and connection usage"""
+    return SystemMetrics(
+        cpu_usage=_cpu_usage,
+        memory_usage=psutil.virtual_memory().percent,
+        disk_usage=_disk_usage,
+        active_connections=_active_conn_count()
+    )
+
+def _active_conn_count() -> int:
+    """Count in-use TCP sockets from /proc/net/sockstat, falling back to psutil off Linux"""
+    try:
+        with open('/proc/net/sockstat') as f:
+            return int(f.read().split('TCP: inuse ')[1].split()[0])
+    except (OSError, IndexError, ValueError):
+        return len(psutil.net_connections(kind='tcp'))
+
+def _get_database_stats() -> Dict[str, Any]:
+    """Count BIN records, users and active subscriptions (uses its own session)"""
+    db = SessionLocal()
+    try:
+        bin_count, user_count, subscription_count = db.execute(DATABASE_STATS_QUERY).first()
         
         return {
-            "basic_health": basic_health.dict(),
-            "system_metrics": system_metrics.dict(),
-            "database_stats": database_stats,
-            "api_endpoints": api_health,
-            "error_summary": error_summary.dict(),
-            "environment": {
-                "python_version": f"{os.sys.version_info.major}.{os.sys.version_info.minor}.{os.sys.version_info.micro}",
-                "debug_mode": os.getenv("DEBUG", "false").lower() == "true",
-                "timezone": str(datetime.now(timezone.utc).astimezone().tzinfo)
-            }
+            "bin_records": bin_count,
+            "total_users": user_count,
+            "active_subscriptions": subscription_count
         }
-        
     except Exception as e:
-        error_tracker.log_api_error(request, e)
-        raise HTTPException(status_code=500, detail="Detailed health check failed")
+        return {"error": str(e)}
+    finally:
+        db.close()
 
 @router.get("/health/database")
+@ttl_cache(seconds=10)
 async def database_health(db: Session = Depends(get_db)):
     """Specific database health check"""
     return health_monitor.check_database_health(db)
@@ -182,36 +304,47 @@ async def get_recent_logs(lines: int = 100):
         
         for log_file in log_files:
             if os.path.exists(log_file):
-                with open(log_file, 'r') as f:
-                    log_lines = f.readlines()
-                    logs[log_file] = log_lines[-lines:] if len(log_lines) > lines else log_lines
+                logs[log_file] = await asyncio.to_thread(_tail, log_file, lines)
         
         return logs
         
     except Exception as e:
         return {"error": str(e)}
 
+def _tail(path: str, lines: int, block_size: int = 8192) -> List[str]:
+    """Return the last `lines` lines of a file, reading backwards in blocks"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b''
+        while position > 0 and data.count(b'\n') <= lines:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            data = f.read(read_size) + data
+    return data.decode(errors='replace').splitlines(keepends=True)[-lines:]
+
 @router.get("/metrics")
+@ttl_cache(seconds=15)
 async def prometheus_metrics():
     """Prometheus-compatible metrics endpoint"""
     try:
-        metrics = []
+        uptime = (datetime.now(timezone.utc) - startup_time).total_seconds()
+        
+        buf = bytearray()
         
         # System metrics
-        metrics.append(f"system_cpu_usage {psutil.cpu_percent()}")
-        metrics.append(f"system_memory_usage {psutil.virtual_memory().percent}")
-        metrics.append(f"system_disk_usage {psutil.disk_usage('/').percent}")
+        buf += f"system_cpu_usage {_cpu_usage}\n".encode()
+        buf += f"system_memory_usage {psutil.virtual_memory().percent}\n".encode()
+        buf += f"system_disk_usage {_disk_usage}\n".encode()
         
-        # Application metrics (these would be tracked in a real application)
-        metrics.append(f"api_requests_total 0")  # Would be tracked
-        metrics.append(f"api_errors_total 0")    # Would be tracked
-        metrics.append(f"payment_transactions_total 0")  # Would be tracked
+        buf += PROMETHEUS_APP_METRICS
         
         # Uptime
-        uptime = (datetime.now(timezone.utc) - startup_time).total_seconds()
-        metrics.append(f"application_uptime_seconds {uptime}")
+        buf += f"application_uptime_seconds {uptime}\n".encode()
         
-        return {"metrics": "\\n".join(metrics)}
+        return Response(content=bytes(buf), media_type=PROMETHEUS_CONTENT_TYPE)
         
     except Exception as e:
-        return {"error": str(e)}
\ No newline at end of file
+        logger.error(f"Metrics collection failed: {e}")
+        raise HTTPException(status_code=500, detail="Metrics collection failed")
\ No newline at end of file
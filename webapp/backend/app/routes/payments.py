@@ -1,20 +1,42 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
 from pydantic import BaseModel
 from typing import Optional, Dict, List
-import json
-import uuid
+import asyncio
+import logging
+import orjson
+import os
+import secrets
 from datetime import datetime, timedelta, timezone
 
-from app.database import get_db
+from app.database import AsyncSessionLocal, get_async_db
 from app.models import User, Subscription, SubscriptionStatus, UserTier
 from app.utils.security import get_current_active_user
 from app.services.crypto_payments import CryptoPaymentManager
+from app.utils.cache import async_ttl_cache
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
+logger = logging.getLogger(__name__)
 
-# Initialize crypto payment manager
-crypto_manager = CryptoPaymentManager()
+# Crypto payment manager, created on first use inside a running worker
+_crypto_manager: Optional[CryptoPaymentManager] = None
+
+def get_crypto_manager() -> CryptoPaymentManager:
+    """Return the shared crypto payment manager, creating it on first use."""
+    global _crypto_manager
+    if _crypto_manager is None:
+        _crypto_manager = CryptoPaymentManager()
+    return _crypto_manager
+
+@router.on_event("shutdown")
+async def close_crypto_manager():
+    """Release pooled provider API connections."""
+    if _crypto_manager is not None:
+        await _crypto_manager.aclose()
 
 # Pydantic models
 class CreateCryptoPaymentRequest(BaseModel):
@@ -55,16 +77,130 @@ class SubscriptionResponse(BaseModel):
     class Config:
         from_attributes = True
 
+# Only the columns SubscriptionResponse needs
+SUBSCRIPTION_RESPONSE_COLUMNS = (
+    Subscription.id,
+    Subscription.status,
+    Subscription.plan_type,
+    Subscription.amount,
+    Subscription.currency,
+    Subscription.payment_method,
+    Subscription.start_date,
+    Subscription.end_date,
+)
+
 # Plan pricing
 PLANS = {
     "premium": {"price_usd": 9.99, "duration_days": 30},
     "api": {"price_usd": 29.99, "duration_days": 30}
 }
+# Coinbase Commerce account is shared with other apps; charges carry this tag
+COINBASE_APP_NAME = "bin_search"
+
+# Per-plan values derived once at import
+_PLAN_META = {
+    name: {
+        "price_usd": plan["price_usd"],
+        "amount_cents": round(plan["price_usd"] * 100),
+        "duration": timedelta(days=plan["duration_days"])
+    }
+    for name, plan in PLANS.items()
+}
+
+# Provider lookups change slowly; estimates follow crypto volatility
+CURRENCIES_CACHE_SECONDS = 900
+ESTIMATE_CACHE_SECONDS = 60
+PAYMENT_STATUS_CACHE_SECONDS = 30
+
+# Webhooks are the source of truth; polling the provider is a development aid
+ENABLE_MANUAL_PAYMENT_POLL = os.getenv("ENABLE_MANUAL_PAYMENT_POLL", "false").lower() == "true"
+
+@async_ttl_cache(CURRENCIES_CACHE_SECONDS, maxsize=1)
+async def get_cached_currencies():
+    return await get_crypto_manager().get_available_currencies()
+
+@async_ttl_cache(ESTIMATE_CACHE_SECONDS)
+async def get_cached_estimate(amount_usd: float, currency: str):
+    return await get_crypto_manager().get_price_estimate(amount_usd, currency)
+
+@async_ttl_cache(PAYMENT_STATUS_CACHE_SECONDS)
+async def get_local_payment_status(user_id: int, payment_id: str):
+    """Subscription state recorded for a provider payment, as updated by webhooks."""
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(
+            select(Subscription.status, Subscription.end_date).where(
+                Subscription.crypto_payment_id == payment_id,
+                Subscription.user_id == user_id
+            ).limit(1)
+        )).first()
+    if row is None:
+        return None
+    return {"subscription_status": row.status, "end_date": row.end_date}
+
+# Static plan catalogue, built once at import
+_PLANS_RESPONSE = {
+    "plans": [
+        {
+            "id": "free",
+            "name": "Free",
+            "price": 0,
+            "currency": "USD",
+            "interval": "month",
+            "features": [
+                "5 card generations per day",
+                "Basic BIN lookup",
+                "Standard card generation"
+            ]
+        },
+        {
+            "id": "premium",
+            "name": "Premium",
+            "price": PLANS["premium"]["price_usd"],
+            "currency": "USD",
+            "interval": "month",
+            "features": [
+                "Unlimited card generation",
+                "AVS postal code generation",
+                "Bulk generation (up to 1000 cards)",
+                "Export in JSON/CSV/XML formats",
+                "Priority support"
+            ]
+        },
+        {
+            "id": "api",
+            "name": "API Access",
+            "price": PLANS["api"]["price_usd"],
+            "currency": "USD",
+            "interval": "month",
+            "features": [
+                "Everything in Premium",
+                "API access with high rate limits",
+                "Webhook support",
+                "Priority support",
+                "Custom integrations"
+            ]
+        }
+    ],
+    "payment_methods": {
+        "cryptocurrency": {
+            "supported": True,
+            "popular_currencies": ["BTC", "ETH", "USDT", "USDC", "LTC"],
+            "total_supported": "200+ cryptocurrencies",
+            "providers": ["NOWPayments", "Coinbase Commerce"]
+        },
+        "paypal": {
+            "supported": False,
+            "note": "Coming soon as backup option"
+        }
+    }
+}
+_PLANS_BYTES = orjson.dumps(_PLANS_RESPONSE)
+_PLANS_HEADERS = {"Cache-Control": "public, max-age=3600"}
 
 @router.get("/currencies")
 async def get_supported_currencies():
     """Get list of supported cryptocurrencies."""
-    currencies = await crypto_manager.get_available_currencies()
+    currencies = await get_cached_currencies()
     return {
         "supported_currencies": currencies,
         "popular": ["btc", "eth", "usdt", "usdc", "ltc"],
@@ -80,13 +216,14 @@ async def get_price_estimate(
     current_user: User = Depends(get_current_active_user)
 ):
     """Get cryptocurrency price estimate for subscription."""
-    if request.plan_type not in PLANS:
+    plan = _PLAN_META.get(request.plan_type)
+    if plan is None:
         raise HTTPException(status_code=400, detail="Invalid plan type")
     
-    amount_usd = PLANS[request.plan_type]["price_usd"]
+    amount_usd = plan["price_usd"]
     
     # Get estimate from crypto service
-    estimate = await crypto_manager.get_price_estimate(amount_usd, request.currency)
+    estimate = await get_cached_estimate(amount_usd, request.currency.lower())
     
     if not estimate:
         raise HTTPException(
@@ -105,26 +242,33 @@ async def get_price_estimate(
 async def create_crypto_payment(
     request: CreateCryptoPaymentRequest,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    crypto_manager: CryptoPaymentManager = Depends(get_crypto_manager)
 ):
     """Create cryptocurrency payment for subscription."""
     
     # Validate plan
-    if request.plan_type not in PLANS:
+    plan = _PLAN_META.get(request.plan_type)
+    if plan is None:
         raise HTTPException(status_code=400, detail="Invalid plan type")
     
     # Check if user already has active subscription
-    active_subscription = db.query(Subscription).filter(
-        Subscription.user_id == current_user.id,
-        Subscription.status == SubscriptionStatus.ACTIVE
-    ).first()
+    active_subscription = await db.scalar(
+        select(Subscription.id).where(
+            Subscription.user_id == current_user.id,
+            Subscription.status == SubscriptionStatus.ACTIVE
+        ).limit(1)
+    )
+    # Hand the connection back to the pool while the provider call is in flight;
+    # the session checks out a fresh one for the insert below
+    await db.close()
     
     if active_subscription:
         raise HTTPException(status_code=400, detail="User already has an active subscription")
     
     # Generate unique order ID
-    order_id = f"sub_{current_user.id}_{uuid.uuid4().hex[:8]}"
-    amount_usd = PLANS[request.plan_type]["price_usd"]
+    order_id = f"sub_{current_user.id}_{secrets.token_hex(4)}"
+    amount_usd = plan["price_usd"]
     
     try:
         # Create payment with crypto service
@@ -140,25 +284,31 @@ async def create_crypto_payment(
         if not payment_result:
             raise HTTPException(status_code=500, detail="Failed to create payment")
         
-        # Store pending subscription
+        # Coinbase charges always carry a hosted_url; anything else is NOWPayments
+        is_coinbase = "hosted_url" in payment_result
+        # Store pending subscription under the id its webhook reports: the
+        # charge id for Coinbase, our order id for NOWPayments
+        stored_payment_id = str(payment_result["id"]) if is_coinbase else order_id
         pending_subscription = Subscription(
             user_id=current_user.id,
+            crypto_payment_id=stored_payment_id,
             status=SubscriptionStatus.UNPAID,
             plan_type=request.plan_type,
-            amount=int(amount_usd * 100),  # Store in cents
+            amount=plan["amount_cents"],  # Store in cents
             currency="USD",
-            start_date=datetime.utcnow(),
+            start_date=datetime.now(timezone.utc),
             # Store payment metadata in a JSON field (you might want to add this to your model)
         )
         
         db.add(pending_subscription)
-        db.commit()
+        await db.commit()
         
-        # Format response based on provider
-        if "payment_url" in payment_result:
+        # Format response based on provider; payment_id is the id the client
+        # polls /payment/{payment_id}/status with
+        if not is_coinbase:
             # NOWPayments response
             response = CryptoPaymentResponse(
-                payment_id=payment_result.get("payment_id", order_id),
+                payment_id=stored_payment_id,
                 payment_url=payment_result.get("payment_url", ""),
                 amount_usd=amount_usd,
                 currency=request.currency.upper(),
@@ -168,7 +318,7 @@ async def create_crypto_payment(
         else:
             # Coinbase Commerce response
             response = CryptoPaymentResponse(
-                payment_id=payment_result.get("id", order_id),
+                payment_id=stored_payment_id,
                 payment_url=payment_result.get("hosted_url", ""),
                 amount_usd=amount_usd,
                 currency=request.currency.upper(),
@@ -178,7 +328,7 @@ async def create_crypto_payment(
         return response
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Payment creation failed: {str(e)}")
 
 @router.get("/payment/{payment_id}/status")
@@ -186,9 +336,26 @@ async def get_payment_status(
     payment_id: str,
     provider: str = "coinbase",
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    crypto_manager: CryptoPaymentManager = Depends(get_crypto_manager)
 ):
-    """Get payment status manually (development friendly)."""
+    """
+    Get payment status.
+    
+    Served from the local subscription record unless ENABLE_MANUAL_PAYMENT_POLL
+    is set, in which case the provider is queried (development friendly).
+    """
+    if not ENABLE_MANUAL_PAYMENT_POLL:
+        local_status = await get_local_payment_status(current_user.id, payment_id)
+        if not local_status:
+            raise HTTPException(status_code=404, detail="Payment not found")
+        return {
+            "payment_id": payment_id,
+            "provider": provider,
+            "status": local_status,
+            "is_confirmed": local_status["subscription_status"] == SubscriptionStatus.ACTIVE
+        }
+    
     try:
         if provider == "coinbase":
             status = await crypto_manager.coinbase.get_charge(payment_id)
@@ -203,14 +370,17 @@ async def get_payment_status(
         # Check if payment is confirmed and update subscription
         is_confirmed = False
         if provider == "coinbase":
-            timeline = status.get("timeline", [])
-            is_confirmed = any(event.get("status") == "CONFIRMED" for event in timeline)
-        elif provider == "nowpayments":
+            for event in status.get("timeline") or ():
+                if event.get("status") == "CONFIRMED":
+                    is_confirmed = True
+                    break
+        else:
             is_confirmed = status.get("payment_status") == "finished"
         
-        # Auto-activate subscription if confirmed (development helper)
-        if is_confirmed and current_user.subscription_tier == "free":
-            await activate_subscription(current_user, "premium", db)
+        # Auto-activate subscription if confirmed (development helper);
+        # tier is a plain column already loaded with the user
+        if is_confirmed and current_user.tier == UserTier.FREE:
+            await activate_subscription(current_user.id, "premium", payment_id, db)
             status["subscription_activated"] = True
         
         return {
@@ -224,42 +394,69 @@ async def get_payment_status(
         raise HTTPException(status_code=400, detail=f"Error checking payment: {str(e)}")
 
 @router.post("/webhook/nowpayments")
-async def nowpayments_webhook(request: Request, db: Session = Depends(get_db)):
+async def nowpayments_webhook(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    crypto_manager: CryptoPaymentManager = Depends(get_crypto_manager)
+):
     """Handle NOWPayments IPN callbacks."""
     payload = await request.body()
     signature = request.headers.get("x-nowpayments-sig", "")
     
     # Verify signature
-    if not crypto_manager.verify_webhook("nowpayments", payload, signature):
+    if not await asyncio.to_thread(crypto_manager.verify_webhook, "nowpayments", payload, signature):
         raise HTTPException(status_code=400, detail="Invalid signature")
     
     try:
-        data = json.loads(payload)
-        await process_payment_update(data, "nowpayments", db)
-        return {"status": "success"}
-    except Exception as e:
-        print(f"NOWPayments webhook error: {e}")
-        raise HTTPException(status_code=400, detail="Webhook processing failed")
+        data = orjson.loads(payload)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid payload")
+    
+    # Acknowledge immediately; the provider retries on slow responses
+    background_tasks.add_task(process_payment_update_task, data, "nowpayments")
+    return {"status": "success"}
 
 @router.post("/webhook/coinbase")
-async def coinbase_webhook(request: Request, db: Session = Depends(get_db)):
+async def coinbase_webhook(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    crypto_manager: CryptoPaymentManager = Depends(get_crypto_manager)
+):
     """Handle Coinbase Commerce webhooks."""
     payload = await request.body()
     signature = request.headers.get("x-cc-webhook-signature", "")
     
     # Verify signature
-    if not crypto_manager.verify_webhook("coinbase", payload, signature):
+    if not await asyncio.to_thread(crypto_manager.verify_webhook, "coinbase", payload, signature):
         raise HTTPException(status_code=400, detail="Invalid signature")
     
     try:
-        data = json.loads(payload)
-        await process_payment_update(data, "coinbase", db)
-        return {"status": "success"}
-    except Exception as e:
-        print(f"Coinbase webhook error: {e}")
-        raise HTTPException(status_code=400, detail="Webhook processing failed")
+        data = orjson.loads(payload)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid payload")
+    
+    # Drop events this app never acts on before scheduling any DB work
+    event = data.get("event") or {}
+    metadata = (event.get("data") or {}).get("metadata") or {}
+    if metadata.get("app_name") != COINBASE_APP_NAME:
+        logger.info("Ignoring webhook for app: %s", metadata.get("app_name", "unknown"))
+        return {"status": "ignored"}
+    if event.get("type") != "charge:confirmed":
+        return {"status": "ignored"}
+    
+    background_tasks.add_task(process_payment_update_task, data, "coinbase")
+    return {"status": "success"}
 
-async def process_payment_update(data: Dict, provider: str, db: Session):
+async def process_payment_update_task(data: Dict, provider: str):
+    """Process a verified webhook after the response, on a session of its own."""
+    async with AsyncSessionLocal() as db:
+        try:
+            await process_payment_update(data, provider, db)
+        except Exception:
+            await db.rollback()
+            logger.exception("%s webhook processing error", provider)
+
+async def process_payment_update(data: Dict, provider: str, db: AsyncSession):
     """Process payment status updates from webhooks."""
     
     if provider == "nowpayments":
@@ -268,11 +465,12 @@ async def process_payment_update(data: Dict, provider: str, db: Session):
         
         # Find user by order ID pattern
         if order_id and order_id.startswith("sub_"):
-            user_id = int(order_id.split("_")[1])
-            user = db.query(User).filter(User.id == user_id).first()
+            # order_id is sub_<user_id>_<suffix>
+            end = order_id.find("_", 4)
+            user_id = int(order_id[4:end if end != -1 else None])
             
-            if user and payment_status == "finished":
-                await activate_subscription(user, data.get("order_description", "premium"), db)
+            if payment_status == "finished":
+                await activate_subscription(user_id, "premium", order_id, db)
                 
     elif provider == "coinbase":
         event_type = data.get("event", {}).get("type")
@@ -282,238 +480,174 @@ async def process_payment_update(data: Dict, provider: str, db: Session):
             metadata = charge_data.get("metadata", {})
             
             # Only process payments for this app
-            if metadata.get("app_name") != "bin_search":
-                print(f"Ignoring webhook for app: {metadata.get('app_name', 'unknown')}")
+            if metadata.get("app_name") != COINBASE_APP_NAME:
                 return
             
             user_email = metadata.get("user_email")
             
             if user_email:
-                user = db.query(User).filter(User.email == user_email).first()
-                if user:
-                    await activate_subscription(user, "premium", db)
+                user_id = await db.scalar(select(User.id).where(User.email == user_email))
+                if user_id:
+                    await activate_subscription(user_id, "premium", charge_data.get("id"), db)
 
-async def activate_subscription(user: User, plan_type: str, db: Session):
-    """Activate user subscription after successful payment."""
+async def activate_subscription(user_id: int, plan_type: str, payment_id: Optional[str], db: AsyncSession):
+    """
+    Activate user subscription after successful payment.
     
-    # Find pending subscription
-    pending_sub = db.query(Subscription).filter(
-        Subscription.user_id == user.id,
-        Subscription.status == SubscriptionStatus.UNPAID
-    ).first()
+    payment_id is the provider id stored on the pending subscription
+    (crypto_payment_id): the order id for NOWPayments, the charge id for Coinbase.
+    The plan recorded on the pending subscription is activated; plan_type is
+    only used when no pending record exists. A subscription that is already
+    active under another payment is canceled and its remaining time carried
+    over to the new one.
+    """
+    now = datetime.now(timezone.utc)
     
-    if pending_sub:
-        # Update existing subscription
-        pending_sub.status = SubscriptionStatus.ACTIVE
-        pending_sub.start_date = datetime.utcnow()
-        pending_sub.end_date = datetime.utcnow() + timedelta(days=PLANS[plan_type]["duration_days"])
-        pending_sub.payment_method = "cryptocurrency"
-    else:
-        # Create new subscription
-        new_subscription = Subscription(
-            user_id=user.id,
-            status=SubscriptionStatus.ACTIVE,
-            plan_type=plan_type,
-            amount=int(PLANS[plan_type]["price_usd"] * 100),
-            currency="USD",
-            payment_method="cryptocurrency",
-            start_date=datetime.utcnow(),
-            end_date=datetime.utcnow() + timedelta(days=PLANS[plan_type]["duration_days"])
+    try:
+        # Lock the pending subscription for this payment; a concurrent
+        # activation holding the row lock is skipped rather than waited on
+        pending = (await db.execute(
+            select(Subscription.id, Subscription.plan_type).where(
+                Subscription.user_id == user_id,
+                Subscription.crypto_payment_id == payment_id,
+                Subscription.status == SubscriptionStatus.UNPAID
+            ).limit(1).with_for_update(skip_locked=True)
+        )).first()
+        
+        if pending is None:
+            already_recorded = await db.scalar(
+                select(Subscription.id).where(
+                    Subscription.user_id == user_id,
+                    Subscription.crypto_payment_id == payment_id
+                ).limit(1)
+            )
+            if already_recorded:
+                # Webhook retry, status poll after activation, or another
+                # activation of this payment in flight
+                await db.rollback()
+                return
+        else:
+            plan_type = pending.plan_type
+        
+        plan = _PLAN_META[plan_type]
+        
+        # Renewal or plan change: retire the current subscription in this
+        # transaction and carry its remaining time over
+        current_end = await db.scalar(
+            update(Subscription)
+            .where(
+                Subscription.user_id == user_id,
+                Subscription.status == SubscriptionStatus.ACTIVE
+            )
+            .values(status=SubscriptionStatus.CANCELED)
+            .returning(Subscription.end_date)
+        )
+        if current_end is not None and current_end.tzinfo is None:
+            current_end = current_end.replace(tzinfo=timezone.utc)
+        end = max(now, current_end or now) + plan["duration"]
+        
+        if pending is not None:
+            await db.execute(
+                update(Subscription)
+                .where(Subscription.id == pending.id)
+                .values(
+                    status=SubscriptionStatus.ACTIVE,
+                    start_date=now,
+                    end_date=end,
+                    payment_method="cryptocurrency"
+                )
+            )
+        else:
+            # No pending record for this payment: create the subscription
+            db.add(Subscription(
+                user_id=user_id,
+                crypto_payment_id=payment_id,
+                status=SubscriptionStatus.ACTIVE,
+                plan_type=plan_type,
+                amount=plan["amount_cents"],
+                currency="USD",
+                payment_method="cryptocurrency",
+                start_date=now,
+                end_date=end
+            ))
+        
+        # Update user tier by id, without loading the user
+        tier = {"premium": UserTier.PREMIUM, "api": UserTier.API}.get(plan_type)
+        if tier is not None:
+            await db.execute(update(User).where(User.id == user_id).values(tier=tier))
+        
+        await db.commit()
+        # Clients polling this payment should see the activation immediately
+        get_local_payment_status.cache_invalidate(user_id, payment_id)
+    except IntegrityError as e:
+        # Only reachable when two different payments for one user activate at
+        # the same moment (ix_sub_user_active); this payment was not applied
+        await db.rollback()
+        logger.error(
+            "Paid %s subscription for user %s not activated (payment %s): %s",
+            plan_type, user_id, payment_id, e.orig
         )
-        db.add(new_subscription)
-    
-    # Update user tier
-    if plan_type == "premium":
-        user.tier = UserTier.PREMIUM
-    elif plan_type == "api":
-        user.tier = UserTier.API
-    
-    db.commit()
 
-@router.get("/subscription", response_model=Optional[SubscriptionResponse])
+@router.get(
+    "/subscription",
+    response_model=SubscriptionResponse,
+    responses={204: {"description": "No subscription"}}
+)
 async def get_current_subscription(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get user's current subscription."""
-    subscription = db.query(Subscription).filter(
-        Subscription.user_id == current_user.id
-    ).order_by(Subscription.created_at.desc()).first()
+    subscription = (await db.execute(
+        select(Subscription).options(load_only(*SUBSCRIPTION_RESPONSE_COLUMNS)).where(
+            Subscription.user_id == current_user.id
+        ).order_by(Subscription.created_at.desc()).limit(1)
+    )).scalars().first()
     
     if not subscription:
-        return None
+        return Response(status_code=204)
     
-    return SubscriptionResponse.from_orm(subscription)
+    # Row comes straight from the ORM, so skip field re-validation
+    return SubscriptionResponse.model_construct(
+        id=subscription.id,
+        status=subscription.status,
+        plan_type=subscription.plan_type,
+        amount=subscription.amount,
+        currency=subscription.currency,
+        payment_method=subscription.payment_method,
+        start_date=subscription.start_date,
+        end_date=subscription.end_date
+    )
 
 @router.post("/cancel-subscription")
 async def cancel_subscription(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Cancel user's current subscription."""
     
     # Find active subscription
-    subscription = db.query(Subscription).filter(
-        Subscription.user_id == current_user.id,
-        Subscription.status == SubscriptionStatus.ACTIVE
-    ).first()
+    subscription = (await db.execute(
+        select(Subscription).where(
+            Subscription.user_id == current_user.id,
+            Subscription.status == SubscriptionStatus.ACTIVE
+        ).limit(1)
+    )).scalars().first()
     
     if not subscription:
         raise HTTPException(status_code=404, detail="No active subscription found")
     
     # Update subscription status
     subscription.status = SubscriptionStatus.CANCELED
-    subscription.end_date = datetime.utcnow()
+    subscription.end_date = datetime.now(timezone.utc)
+    await db.execute(update(User).where(User.id == current_user.id).values(tier=UserTier.FREE))
     current_user.tier = UserTier.FREE
     
-    db.commit()
+    await db.commit()
     
     return {"message": "Subscription canceled successfully"}
 
 @router.get("/plans")
 async def get_available_plans():
     """Get available subscription plans."""
-    return {
-        "plans": [
-            {
-                "id": "free",
-                "name": "Free",
-                "price": 0,
-                "currency": "USD",
-                "interval": "month",
-                "features": [
-                    "5 card generations per day",
-                    "Basic BIN lookup",
-                    "Standard card generation"
-                ]
-            },
-            {
-                "id": "premium",
-                "name": "Premium",
-                "price": PLANS["premium"]["price_usd"],
-                "currency": "USD",
-                "interval": "month",
-                "features": [
-                    "Unlimited card generation",
-                    "AVS postal code generation",
-                    "Bulk generation (up to 1000 cards)",
-                    "Export in JSON/CSV/XML formats",
-                    "Priority support"
-                ]
-            },
-            {
-                "id": "api",
-                "name": "API Access",
-                "price": PLANS["api"]["price_usd"],
-                "currency": "USD",
-                "interval": "month",
-                "features": [
-                    "Everything in Premium",
-                    "API access with high rate limits",
-                    "Webhook support",
-                    "Priority support",
-                    "Custom integrations"
-                ]
-            }
-        ],
-        "payment_methods": {
-            "cryptocurrency": {
-                "supported": True,
-                "popular_currencies": ["BTC", "ETH", "USDT", "USDC", "LTC"],
-                "total_supported": "200+ cryptocurrencies",
-                "providers": ["NOWPayments", "Coinbase Commerce"]
-            },
-            "paypal": {
-                "supported": False,
-                "note": "Coming soon as backup option"
-            }
-        }
-    }
-
-@router.get("/subscription", response_model=Optional[SubscriptionResponse])
-async def get_current_subscription(
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """
-    Get user's current subscription.
-    """
-    subscription = db.query(Subscription).filter(
-        Subscription.user_id == current_user.id
-    ).order_by(Subscription.created_at.desc()).first()
-    
-    if not subscription:
-        return None
-    
-    return SubscriptionResponse.from_orm(subscription)
-
-@router.post("/cancel-subscription")
-async def cancel_subscription(
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """
-    Cancel user's current subscription.
-    """
-    # Find active subscription
-    subscription = db.query(Subscription).filter(
-        Subscription.user_id == current_user.id,
-        Subscription.status == SubscriptionStatus.ACTIVE
-    ).first()
-    
-    if not subscription:
-        raise HTTPException(status_code=404, detail="No active subscription found")
-    
-    try:
-        # Cancel in Stripe
-        if subscription.stripe_subscription_id:
-            stripe.Subscription.delete(subscription.stripe_subscription_id)
-        
-        # Update local record
-        subscription.status = SubscriptionStatus.CANCELED
-        subscription.end_date = datetime.utcnow()
-        current_user.tier = UserTier.FREE
-        
-        db.commit()
-        
-        return {"message": "Subscription canceled successfully"}
-        
-    except stripe.error.StripeError as e:
-        raise HTTPException(status_code=400, detail=f"Stripe error: {str(e)}")
-
-@router.get("/plans")
-async def get_available_plans():
-    """
-    Get available subscription plans.
-    """
-    return {
-        "plans": [
-            {
-                "id": "free",
-                "name": "Free",
-                "price": 0,
-                "currency": "USD",
-                "interval": "month",
-                "features": [
-                    "5 card generations per day",
-                    "Basic BIN lookup",
-                    "Standard card generation"
-                ]
-            },
-            {
-                "id": "premium",
-                "name": "Premium",
-                "price": 999,  # $9.99 in cents
-                "currency": "USD",
-                "interval": "month",
-                "stripe_price_id": STRIPE_PRICE_ID_PREMIUM,
-                "features": [
-                    "Unlimited card generation",
-                    "AVS postal code generation",
-                    "Bulk generation (up to 1000 cards)",
-                    "Export in JSON/CSV/XML formats",
-                    "Priority support"
-                ]
-            }
-        ]
-    }
+    return Response(content=_PLANS_BYTES, media_type="application/json", headers=_PLANS_HEADERS)
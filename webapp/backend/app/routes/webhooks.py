@@ -4,30 +4,79 @@ Handles cryptocurrency payment webhooks with comprehensive security
 """
 
 from fastapi import APIRouter, Request, HTTPException, BackgroundTasks, Depends
+from sqlalchemy import Integer, String, Text, insert, literal, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from typing import Dict, Any, Optional
+from pydantic import BaseModel, ConfigDict
+from typing import Dict, Any, Optional, Tuple
+import asyncio
 import hmac
 import hashlib
-import json
+import logging
 import time
 from datetime import datetime, timezone
 
-from app.database import get_db, get_redis
+from app.database import get_db, get_async_redis, reset_async_redis_on_error
 from app.models import User, PaymentLog, UserTier
 from app.services.security_service import SecurityService
 from app.services.webhook_security import WebhookSecurityService
+from app.utils.signatures import signature_matches
 import os
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 security_service = SecurityService()
 webhook_security = WebhookSecurityService()
 
+# How long a processed webhook id is remembered for duplicate detection
+WEBHOOK_DEDUP_TTL_SECONDS = 86400
+
 # Webhook secrets (store in environment variables)
 COINBASE_WEBHOOK_SECRET = os.getenv("COINBASE_WEBHOOK_SECRET", "your-coinbase-webhook-secret")
 CRYPTO_PAYMENT_SECRET = os.getenv("CRYPTO_PAYMENT_SECRET", "your-crypto-payment-secret")
+CRYPTO_PAYMENT_SECRET_BYTES = CRYPTO_PAYMENT_SECRET.encode()
+COINBASE_WEBHOOK_SECRET_BYTES = COINBASE_WEBHOOK_SECRET.encode()
+
+# Webhook bodies are small JSON documents; cap size and read time
+WEBHOOK_MAX_BODY_BYTES = 1 << 20
+WEBHOOK_BODY_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_BODY_TIMEOUT_SECONDS", "10"))
+
+async def read_signed_body(request: Request, secret: bytes) -> Tuple[bytes, bytes]:
+    """
+    Stream the request body while computing its HMAC-SHA256.
+    
+    Returns (body, digest). Oversized bodies are rejected with 413 as soon as
+    the declared or received length passes WEBHOOK_MAX_BODY_BYTES, and slow
+    senders with 408 after WEBHOOK_BODY_TIMEOUT_SECONDS.
+    """
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > WEBHOOK_MAX_BODY_BYTES:
+        raise HTTPException(status_code=413, detail="Webhook payload too large")
+    
+    mac = hmac.new(secret, digestmod=hashlib.sha256)
+    body = bytearray()
+    
+    async def consume():
+        async for chunk in request.stream():
+            if len(body) + len(chunk) > WEBHOOK_MAX_BODY_BYTES:
+                raise HTTPException(status_code=413, detail="Webhook payload too large")
+            body.extend(chunk)
+            mac.update(chunk)
+    
+    try:
+        await asyncio.wait_for(consume(), WEBHOOK_BODY_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=408, detail="Webhook body read timed out")
+    
+    return bytes(body), mac.digest()
+
+# Webhook payloads: ignore unknown fields and bound string sizes so that
+# oversized values fail validation instead of being copied around
+WEBHOOK_MODEL_CONFIG = ConfigDict(extra='ignore', str_max_length=4096)
 
 class CoinbaseWebhookPayload(BaseModel):
+    model_config = WEBHOOK_MODEL_CONFIG
+    
     id: str
     resource: str
     resource_path: str
@@ -37,6 +86,8 @@ class CoinbaseWebhookPayload(BaseModel):
     data: Dict[str, Any]
 
 class PaymentWebhookPayload(BaseModel):
+    model_config = WEBHOOK_MODEL_CONFIG
+    
     transaction_id: str
     user_id: str
     amount: str
@@ -56,9 +107,6 @@ async def handle_coinbase_webhook(
     Handle Coinbase Commerce webhooks with maximum security.
     This is CRITICAL - fake payments could give free premium access.
     """
-    # Get raw body for signature verification
-    body = await request.body()
-    
     # CRITICAL: Verify webhook signature
     signature = request.headers.get('X-CC-Webhook-Signature')
     if not signature:
@@ -67,10 +115,11 @@ async def handle_coinbase_webhook(
         )
         raise HTTPException(status_code=401, detail="Missing webhook signature")
     
-    # Verify Coinbase signature
-    is_valid = webhook_security.verify_coinbase_signature(
-        body, signature, COINBASE_WEBHOOK_SECRET
-    )
+    # Read the raw body and HMAC it in one pass
+    body, expected_digest = await read_signed_body(request, COINBASE_WEBHOOK_SECRET_BYTES)
+    
+    # Verify Coinbase signature (hex HMAC-SHA256 of the body)
+    is_valid = signature_matches(expected_digest, signature)
     
     if not is_valid:
         await security_service.log_security_event(
@@ -99,13 +148,14 @@ async def handle_coinbase_webhook(
             raise HTTPException(status_code=401, detail="Webhook timestamp too old")
     
     try:
-        payload_data = json.loads(body.decode('utf-8'))
-        payload = CoinbaseWebhookPayload(**payload_data)
+        # Parse and validate in one pass with pydantic-core's JSON reader
+        payload = CoinbaseWebhookPayload.model_validate_json(body)
         
         # Process the webhook in background to avoid blocking
         background_tasks.add_task(
             process_coinbase_payment,
             payload,
+            body,
             request.client.host,
             db
         )
@@ -131,9 +181,6 @@ async def handle_crypto_payment_webhook(
     """
     Handle generic crypto payment webhooks with advanced security.
     """
-    # Get raw body for signature verification
-    body = await request.body()
-    
     # CRITICAL: IP whitelist check for crypto payment providers
     client_ip = request.client.host
     allowed_ips = os.getenv("CRYPTO_WEBHOOK_ALLOWED_IPS", "").split(",")
@@ -152,13 +199,12 @@ async def handle_crypto_payment_webhook(
     if not signature:
         raise HTTPException(status_code=401, detail="Missing webhook signature")
     
-    expected_signature = hmac.new(
-        CRYPTO_PAYMENT_SECRET.encode(),
-        body,
-        hashlib.sha256
-    ).hexdigest()
+    # Read the raw body and HMAC it in one pass
+    body, expected_digest = await read_signed_body(request, CRYPTO_PAYMENT_SECRET_BYTES)
+    
+    is_valid = signature.startswith("sha256=") and signature_matches(expected_digest, signature[7:])
     
-    if not hmac.compare_digest(signature, f"sha256={expected_signature}"):
+    if not is_valid:
         await security_service.log_security_event(
             request, "INVALID_CRYPTO_WEBHOOK_SIGNATURE", {
                 "service": "crypto_payment",
@@ -171,9 +217,18 @@ async def handle_crypto_payment_webhook(
     # Check for duplicate webhooks (replay attack prevention)
     webhook_id = request.headers.get('X-Webhook-ID')
     if webhook_id:
-        redis_client = get_redis()
-        duplicate_key = f"webhook_processed:{webhook_id}"
-        if redis_client.exists(duplicate_key):
+        # Claim the id atomically: SET NX succeeds only for the first delivery
+        try:
+            redis = await get_async_redis()
+            first_delivery = await redis.set(
+                f"webhook_processed:{webhook_id}", "processed", nx=True, ex=WEBHOOK_DEDUP_TTL_SECONDS
+            )
+        except Exception as e:
+            reset_async_redis_on_error(e)
+            logger.warning("Webhook duplicate check unavailable: %s", e)
+            first_delivery = True
+        
+        if not first_delivery:
             await security_service.log_security_event(
                 request, "DUPLICATE_WEBHOOK_DETECTED", {
                     "service": "crypto_payment",
@@ -182,18 +237,15 @@ async def handle_crypto_payment_webhook(
                 }
             )
             return {"status": "duplicate", "message": "Webhook already processed"}
-        
-        # Mark as processed for 24 hours
-        redis_client.setex(duplicate_key, 86400, "processed")
     
     try:
-        payload_data = json.loads(body.decode('utf-8'))
-        payload = PaymentWebhookPayload(**payload_data)
+        payload = PaymentWebhookPayload.model_validate_json(body)
         
         # Process the payment in background
         background_tasks.add_task(
             process_crypto_payment,
             payload,
+            body,
             request.client.host,
             db
         )
@@ -209,8 +261,58 @@ async def handle_crypto_payment_webhook(
         )
         raise HTTPException(status_code=400, detail="Invalid webhook payload")
 
+def record_confirmed_payment(
+    db: Session,
+    user_id: Any,
+    payment_id: str,
+    amount: Any,
+    currency: str,
+    payment_method: str,
+    provider: str,
+    raw_body: bytes,
+    upgrade: bool
+) -> bool:
+    """
+    Log a confirmed payment and optionally upgrade the user, in one transaction.
+    
+    The PaymentLog row is inserted with INSERT ... SELECT FROM users, so an
+    unknown user simply inserts nothing and no separate user lookup is made.
+    Returns False if the user does not exist or the payment was already logged.
+    """
+    amount_cents = int(round(float(amount) * 100)) if amount else 0
+    source = select(
+        User.id,
+        literal(payment_id, String),
+        literal(amount_cents, Integer),
+        literal(currency, String),
+        literal(payment_method, String),
+        literal("confirmed", String),
+        literal(provider, String),
+        literal(raw_body.decode('utf-8'), Text)
+    ).where(User.id == int(user_id))
+    stmt = insert(PaymentLog).from_select(
+        ["user_id", "payment_id", "amount", "currency", "payment_method",
+         "status", "provider", "webhook_data"],
+        source
+    ).returning(PaymentLog.user_id)
+    
+    try:
+        logged_user_id = db.execute(stmt).scalar()
+        if logged_user_id is None:
+            db.rollback()
+            return False
+        if upgrade:
+            db.execute(update(User).where(User.id == logged_user_id).values(tier=UserTier.PREMIUM))
+        db.commit()
+    except IntegrityError:
+        # payment_id is unique: this payment has already been recorded
+        db.rollback()
+        return False
+    return True
+
 async def process_coinbase_payment(
     payload: CoinbaseWebhookPayload,
+    raw_body: bytes,
     client_ip: str,
     db: Session
 ):
@@ -231,37 +333,22 @@ async def process_coinbase_payment(
             if not user_id:
                 return
             
-            user = db.query(User).filter(User.id == user_id).first()
-            if not user:
-                return
-            
-            # Log payment
-            payment_log = PaymentLog(
-                user_id=user.id,
-                transaction_id=charge_id,
-                amount=float(amount) if amount else 0.0,
-                currency=currency or "USD",
-                payment_method="coinbase",
-                status="confirmed",
-                webhook_ip=client_ip,
-                raw_webhook_data=json.dumps(payload.dict())
+            # Log payment and upgrade user to premium
+            record_confirmed_payment(
+                db, user_id, charge_id, amount, currency or "USD",
+                payment_method="cryptocurrency", provider="coinbase",
+                raw_body=raw_body, upgrade=True
             )
-            db.add(payment_log)
-            
-            # Upgrade user to premium
-            user.tier = UserTier.PREMIUM
-            user.premium_expires_at = datetime.now(timezone.utc) + timedelta(days=30)
-            
-            db.commit()
             
             # TODO: Send confirmation email
             
     except Exception as e:
         # Log error but don't raise (webhook should return 200)
-        print(f"Error processing Coinbase webhook: {e}")
+        logger.error("Error processing Coinbase webhook from %s: %s", client_ip, e)
 
 async def process_crypto_payment(
     payload: PaymentWebhookPayload,
+    raw_body: bytes,
     client_ip: str,
     db: Session
 ):
@@ -270,32 +357,16 @@ async def process_crypto_payment(
     """
     try:
         if payload.status == "confirmed":
-            user = db.query(User).filter(User.id == payload.user_id).first()
-            if not user:
-                return
-            
-            # Log payment
-            payment_log = PaymentLog(
-                user_id=user.id,
-                transaction_id=payload.transaction_id,
-                amount=float(payload.amount),
-                currency=payload.currency,
-                payment_method=payload.payment_method,
-                status=payload.status,
-                webhook_ip=client_ip,
-                raw_webhook_data=json.dumps(payload.dict())
+            # Log payment, upgrading the user based on payment amount ($10+ for premium)
+            record_confirmed_payment(
+                db, payload.user_id, payload.transaction_id, payload.amount,
+                payload.currency, payment_method=payload.payment_method,
+                provider="crypto_payment", raw_body=raw_body,
+                upgrade=float(payload.amount) >= 10.0
             )
-            db.add(payment_log)
-            
-            # Upgrade user based on payment amount
-            if float(payload.amount) >= 10.0:  # $10+ for premium
-                user.tier = UserTier.PREMIUM
-                user.premium_expires_at = datetime.now(timezone.utc) + timedelta(days=30)
-            
-            db.commit()
             
     except Exception as e:
-        print(f"Error processing crypto payment webhook: {e}")
+        logger.error("Error processing crypto payment webhook from %s: %s", client_ip, e)
 
 @router.get("/webhook-status")
 async def webhook_status():
@@ -1,11 +1,59 @@
 from typing import Optional
 import pandas as pd
+import io
 import os
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from app.database import SessionLocal
 from app.models import BinData, BlockedBin
 
+# BinData column -> (CSV column, max length)
+BIN_COLUMN_SOURCES = {
+    "brand": ("brand", 50),
+    "issuer": ("issuer", 255),
+    "type": ("type", 50),
+    "level": ("category", 50),
+    "country_code": ("alpha_2", 2),
+    "country_name": ("country", 100),
+    "bank_phone": ("bank_phone", 50),
+    "bank_url": ("bank_url", 255),
+}
+BIN_COLUMNS = ["bin", *BIN_COLUMN_SOURCES]
+
+def _prepare_bin_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Map cleaned CSV columns onto bin_data columns, truncated, with None for missing values.
+    """
+    prepared = pd.DataFrame({"bin": df["bin"].str[:6]})
+    for column, (source, max_length) in BIN_COLUMN_SOURCES.items():
+        if source in df:
+            values = df[source]
+            prepared[column] = values.astype(str).str.slice(0, max_length).astype(object).where(values.notna(), None)
+        else:
+            prepared[column] = None
+    return prepared
+
+def _copy_bin_frame(db: Session, records: pd.DataFrame):
+    """
+    Stream records into bin_data with PostgreSQL COPY.
+    """
+    buffer = io.StringIO()
+    records.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    
+    raw_connection = db.connection().connection
+    with raw_connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY bin_data({', '.join(BIN_COLUMNS)}) FROM STDIN WITH CSV", buffer)
+
+def _insert_ignoring_duplicate_bins(db: Session, model):
+    """
+    INSERT ... ON CONFLICT (bin) DO NOTHING for the session's dialect.
+    """
+    insert = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    return insert(model).on_conflict_do_nothing(index_elements=["bin"])
+
 async def import_bin_data():
     """
     Import BIN data from CSV file into database.
@@ -37,48 +85,43 @@ async def import_bin_data():
         df['bin'] = df['bin'].astype(str).str.strip()
         df = df[df['bin'].str.len() >= 6]  # Only keep valid BINs
         df['bin'] = df['bin'].str[:6]  # Take first 6 digits
-        df = df.drop_duplicates(subset=['bin'])  # Remove duplicates
         
-        print(f"🧹 Cleaned data: {len(df):,} unique BINs")
+        print(f"🧹 Cleaned data: {len(df):,} BINs")
         
-        # Batch insert for performance
-        batch_size = 1000
-        imported_count = 0
+        # Normalize columns once, then load without building ORM objects
+        records = _prepare_bin_frame(df)
         
-        for _ in range(0, len(df), batch_size):
-            batch_df = df.iloc[i:i + batch_size]
-            
-            bin_records = []
-            for _, row in batch_df.iterrows():
-                bin_record = BinData(
-                    bin=str(row.get('bin', ''))[:6],
-                    brand=str(row.get('brand', ''))[:50] if pd.notna(row.get('brand')) else None,
-                    issuer=str(row.get('issuer', ''))[:255] if pd.notna(row.get('issuer')) else None,
-                    type=str(row.get('type', ''))[:50] if pd.notna(row.get('type')) else None,
-                    level=str(row.get('category', ''))[:50] if pd.notna(row.get('category')) else None,
-                    country_code=str(row.get('alpha_2', ''))[:2] if pd.notna(row.get('alpha_2')) else None,
-                    country_name=str(row.get('country', ''))[:100] if pd.notna(row.get('country')) else None,
-                    bank_phone=str(row.get('bank_phone', ''))[:50] if pd.notna(row.get('bank_phone')) else None,
-                    bank_url=str(row.get('bank_url', ''))[:255] if pd.notna(row.get('bank_url')) else None
-                )
-                bin_records.append(bin_record)
-            
-            # Bulk insert
-            db.bulk_save_objects(bin_records)
+        if db.get_bind().dialect.name == "postgresql":
+            # COPY cannot skip conflicts, so duplicates are removed up front
+            records = records.drop_duplicates(subset=['bin'])
+            _copy_bin_frame(db, records)
             db.commit()
+            imported_count = len(records)
+        else:
+            # Batch insert for performance
+            batch_size = 1000
+            # Duplicate BINs are skipped by the unique index; the first row wins
+            insert_bins = _insert_ignoring_duplicate_bins(db, BinData)
+            
+            for start in range(0, len(records), batch_size):
+                batch = records.iloc[start:start + batch_size].to_dict(orient="records")
+                db.execute(insert_bins, batch)
+                db.commit()
+                
+                processed = start + len(batch)
+                if processed % 10000 == 0:
+                    print(f"📥 Processed {processed:,} BIN rows...")
             
-            imported_count += len(bin_records)
-            if imported_count % 10000 == 0:
-                print(f"📥 Imported {imported_count:,} BINs...")
+            # The table was empty, so its row count is what actually landed
+            # (rowcount is unreliable for skipped conflicts in batched inserts)
+            imported_count = db.query(BinData).count()
         
         print(f"✅ Successfully imported {imported_count:,} BIN records")
         
-        # Create indexes for performance
-        print("🔧 Creating database indexes...")
-        db.execute(text("CREATE INDEX IF NOT EXISTS idx_bin_data_bin ON bin_data(bin)"))
-        db.execute(text("CREATE INDEX IF NOT EXISTS idx_bin_data_brand ON bin_data(brand)"))
-        db.execute(text("CREATE INDEX IF NOT EXISTS idx_bin_data_country ON bin_data(country_code)"))
-        db.execute(text("CREATE INDEX IF NOT EXISTS idx_bin_data_issuer ON bin_data(issuer)"))
+        # bin, brand, country_code and issuer are already indexed by the model;
+        # refresh planner statistics now that the table is loaded
+        print("🔧 Analyzing bin_data...")
+        db.execute(text("ANALYZE bin_data"))
         db.commit()
         
         # Insert blocked test BINs
@@ -99,15 +142,15 @@ async def import_bin_data():
             ("356600", "Test BIN - Diners Club")
         ]
         
-        blocked_records = [
-            BlockedBin(bin=bin_num, reason=reason) 
-            for bin_num, reason in test_bins
-        ]
-        
-        db.bulk_save_objects(blocked_records)
+        # Idempotent, so BINs left behind by an aborted earlier run don't fail the seed
+        db.execute(
+            _insert_ignoring_duplicate_bins(db, BlockedBin).values(
+                [{"bin": bin_num, "reason": reason} for bin_num, reason in test_bins]
+            )
+        )
         db.commit()
         
-        print(f"🚫 Added {len(blocked_records)} blocked test BINs")
+        print(f"🚫 Added {len(test_bins)} blocked test BINs")
         print("🎉 BIN data import completed successfully!")
         
     except Exception as e:
@@ -144,14 +187,14 @@ def get_bin_stats(db: Session):
     """
     Get database statistics.
     """
-    total_bins = db.query(BinData).count()
-    brands = db.query(BinData.brand).distinct().count()
-    countries = db.query(BinData.country_name).distinct().count()
-    issuers = db.query(BinData.issuer).distinct().count()
+    # One scan computing all four aggregates
+    row = db.execute(
+        select(
+            func.count().label("total_bins"),
+            func.count(BinData.brand.distinct()).label("brands"),
+            func.count(BinData.country_name.distinct()).label("countries"),
+            func.count(BinData.issuer.distinct()).label("issuers")
+        ).select_from(BinData)
+    ).one()
     
-    return {
-        "total_bins": total_bins,
-        "brands": brands,
-        "countries": countries,
-        "issuers": issuers
-    }
+    return row._asdict()
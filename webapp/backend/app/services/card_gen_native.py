@@ -0,0 +1,103 @@
+"""
+Numba-compiled card number generation.
+
+Mirrors create_card_number in card_generator: weighted digits capped at two
+occurrences each, rejection of identical/ascending/descending runs of three,
+and a Luhn check digit. Numba is optional; NATIVE_AVAILABLE is False when it
+is not installed and callers fall back to the pure Python path.
+"""
+import os
+
+import numpy as np
+
+try:
+    from numba import njit
+    NATIVE_AVAILABLE = True
+except ImportError:
+    NATIVE_AVAILABLE = False
+
+MAX_ATTEMPTS = 100
+
+# Weighted digit pool (0-5 have weight 2, 6-9 have weight 1); card_generator
+# expands the same table for the pure Python path
+DIGIT_WEIGHTS = (2, 2, 2, 2, 2, 2, 1, 1, 1, 1)
+_WEIGHTED_DIGITS = np.array(
+    [digit for digit, weight in enumerate(DIGIT_WEIGHTS) for _ in range(weight)], dtype=np.int64
+)
+_LUHN_DOUBLED = np.array([0, 2, 4, 6, 8, 1, 3, 5, 7, 9], dtype=np.int64)
+
+if NATIVE_AVAILABLE:
+    @njit(cache=True)
+    def _seed(seed):
+        np.random.seed(seed)
+
+    @njit(cache=True, nogil=True)
+    def _has_bad_triples(digits, count):
+        for i in range(count - 2):
+            step = digits[i + 1] - digits[i]
+            if -1 <= step <= 1 and digits[i + 2] - digits[i + 1] == step:
+                return True
+        return False
+
+    @njit(cache=True, nogil=True)
+    def _fill_check_digit(number, length):
+        # number[:length - 1] holds the digits; walk right to left from the last one
+        total = 0
+        double = True
+        for i in range(length - 2, -1, -1):
+            total += _LUHN_DOUBLED[number[i]] if double else number[i]
+            double = not double
+        number[length - 1] = (10 - total % 10) % 10
+
+    @njit(cache=True, nogil=True)
+    def _generate_into(prefix, target_length, out):
+        prefix_length = prefix.shape[0]
+        remaining = max(target_length - prefix_length - 1, 0)
+        length = prefix_length + remaining + 1
+        out[:prefix_length] = prefix
+        digits = out[prefix_length:prefix_length + remaining]
+        counts = np.zeros(10, dtype=np.int64)
+        alternatives = np.empty(_WEIGHTED_DIGITS.shape[0], dtype=np.int64)
+        
+        for _ in range(MAX_ATTEMPTS):
+            counts[:] = 0
+            for j in range(remaining):
+                digit = _WEIGHTED_DIGITS[np.random.randint(0, _WEIGHTED_DIGITS.shape[0])]
+                if counts[digit] >= 2:
+                    available = 0
+                    for candidate in _WEIGHTED_DIGITS:
+                        if counts[candidate] < 2:
+                            alternatives[available] = candidate
+                            available += 1
+                    if available:
+                        digit = alternatives[np.random.randint(0, available)]
+                    else:
+                        digit = np.random.randint(0, 10)
+                counts[digit] += 1
+                digits[j] = digit
+            
+            if not _has_bad_triples(digits, remaining):
+                _fill_check_digit(out, length)
+                return length
+        
+        # Fallback: plain random digits
+        for j in range(remaining):
+            digits[j] = np.random.randint(0, 10)
+        _fill_check_digit(out, length)
+        return length
+
+    @njit(cache=True, nogil=True)
+    def generate_card_digits(prefix, target_length):
+        """Generate one card number as an int64 digit array."""
+        out = np.empty(max(target_length, prefix.shape[0] + 1), dtype=np.int64)
+        length = _generate_into(prefix, target_length, out)
+        return out[:length]
+
+    # Numba keeps its own RNG state, separate from numpy's and random's
+    _seed(int.from_bytes(os.urandom(4), "little"))
+    # Compile (or load from cache) now rather than on the first request
+    generate_card_digits(np.array([4, 0, 0, 0, 0, 0], dtype=np.int64), 16)
+
+def digits_to_str(digits) -> str:
+    """Convert a digit array back into a card number string."""
+    return (np.asarray(digits) + 48).astype(np.uint8).tobytes().decode("ascii")
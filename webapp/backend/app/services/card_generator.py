@@ -1,11 +1,19 @@
+import asyncio
 import random
 import hashlib
+import time
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
 from sqlalchemy.orm import Session
 
 from app.models import BinData, BlockedBin
 from app.database import get_redis
+from app.services.card_gen_native import DIGIT_WEIGHTS, NATIVE_AVAILABLE
+
+if NATIVE_AVAILABLE:
+    import numpy as np
+    from app.services.card_gen_native import digits_to_str, generate_card_digits
 
 # Test BINs to block (from your existing bot)
 TEST_BINS = {
@@ -24,8 +32,69 @@ AVS_POSTAL_CODES = {
     "DE": ["10115", "20095", "80331", "50667", "01067"],  # Berlin, Hamburg, Munich, Cologne, Dresden
     "FR": ["75001", "69001", "13001", "31000", "59000"]   # Paris, Lyon, Marseille, Toulouse, Lille
 }
+# Immutable choice tables keyed by upper-case country code
+_AVS_CHOICES = {country: tuple(codes) for country, codes in AVS_POSTAL_CODES.items()}
+
+# Weighted digit pool from DIGIT_WEIGHTS, expanded so a plain choice() draws
+# with the same distribution as choices(weights=...)
+_WEIGHTED_DIGITS = tuple(digit for digit, weight in enumerate(DIGIT_WEIGHTS) for _ in range(weight))
+_choice = random.choice
+
+AMEX_PREFIXES = frozenset({"34", "37"})
+
+# Display groupings keyed on card length; other lengths fall back to groups of four
+CARD_DISPLAY_FORMATS = {
+    15: lambda n: f"{n[:4]} {n[4:10]} {n[10:]}",  # American Express
+    16: lambda n: f"{n[:4]} {n[4:8]} {n[8:12]} {n[12:]}",
+    19: lambda n: f"{n[:4]} {n[4:8]} {n[8:12]} {n[12:16]} {n[16:]}",
+}
+
+def _group_by_four(number: str) -> str:
+    return ' '.join(number[i:i + 4] for i in range(0, len(number), 4))
 
-def validate_bin(bin_input: str, db: Session) -> Tuple[bool, str, Optional[BinData]]:
+class BinRecord(NamedTuple):
+    """Immutable snapshot of a bin_data row, safe to share across requests."""
+    bin: str
+    brand: Optional[str]
+    issuer: Optional[str]
+    type: Optional[str]
+    level: Optional[str]
+    country_code: Optional[str]
+    country_name: Optional[str]
+    bank_phone: Optional[str]
+    bank_url: Optional[str]
+
+BIN_RECORD_COLUMNS = tuple(getattr(BinData, field) for field in BinRecord._fields)
+BIN_RECORD_CACHE_SIZE = 65536
+BLOCKED_BINS_REFRESH_SECONDS = 300
+
+# BIN rows are static once imported; blocked BINs are a tiny table refreshed periodically
+_bin_records: Dict[str, BinRecord] = {}
+_blocked_bins: Dict[str, str] = {}
+_blocked_bins_loaded_at = float("-inf")
+
+def _get_blocked_bins(db: Session) -> Dict[str, str]:
+    """Blocked BIN prefix -> reason, reloaded every BLOCKED_BINS_REFRESH_SECONDS."""
+    global _blocked_bins, _blocked_bins_loaded_at
+    now = time.monotonic()
+    if now - _blocked_bins_loaded_at > BLOCKED_BINS_REFRESH_SECONDS:
+        _blocked_bins = dict(db.query(BlockedBin.bin, BlockedBin.reason).all())
+        _blocked_bins_loaded_at = now
+    return _blocked_bins
+
+def _get_bin_record(bin_prefix: str, db: Session) -> Optional[BinRecord]:
+    """Cached bin_data lookup; misses are not cached so later imports are seen."""
+    record = _bin_records.get(bin_prefix)
+    if record is None:
+        row = db.query(*BIN_RECORD_COLUMNS).filter(BinData.bin == bin_prefix).first()
+        if row is None:
+            return None
+        if len(_bin_records) >= BIN_RECORD_CACHE_SIZE:
+            _bin_records.pop(next(iter(_bin_records)))
+        record = _bin_records[bin_prefix] = BinRecord(*row)
+    return record
+
+def validate_bin(bin_input: str, db: Session) -> Tuple[bool, str, Optional[BinRecord]]:
     """
     Validate BIN against database and blocked BINs.
     Returns (is_valid, message, bin_data)
@@ -45,50 +114,77 @@ def validate_bin(bin_input: str, db: Session) -> Tuple[bool, str, Optional[BinDa
         return False, "Test BIN blocked - use production BINs only", None
     
     # Check database blocked list
-    blocked = db.query(BlockedBin).filter(BlockedBin.bin == bin_prefix).first()
-    if blocked:
-        return False, f"BIN blocked: {blocked.reason}", None
+    blocked_reason = _get_blocked_bins(db).get(bin_prefix)
+    if blocked_reason is not None:
+        return False, f"BIN blocked: {blocked_reason}", None
     
     # Look up in database
-    bin_data = db.query(BinData).filter(BinData.bin == bin_prefix).first()
+    bin_data = _get_bin_record(bin_prefix, db)
     if not bin_data:
         return False, "BIN not found in database", None
     
     return True, "Valid BIN", bin_data
 
+# Brand substring -> possible card lengths, checked in order
+BRAND_CARD_LENGTHS = (
+    ("AMERICAN EXPRESS", (15,)),
+    ("AMEX", (15,)),
+    ("DINERS", (14, 16)),
+    ("DISCOVER", (16, 19)),
+)
+DEFAULT_CARD_LENGTHS = (16,)  # Visa, Mastercard, prepaid, etc.
+
+@lru_cache(maxsize=256)
+def _brand_card_lengths(brand: Optional[str]) -> Tuple[int, ...]:
+    """Possible card lengths for a brand; there are only a handful of brands."""
+    brand_upper = brand.upper() if brand else ""
+    for token, lengths in BRAND_CARD_LENGTHS:
+        if token in brand_upper:
+            return lengths
+    return DEFAULT_CARD_LENGTHS
+
 def get_card_length(brand: str, card_type: Optional[str] = None) -> int:
     """
     Get appropriate card length based on brand and type.
     """
-    brand_upper = brand.upper() if brand else ""
-    
-    if "AMERICAN EXPRESS" in brand_upper or "AMEX" in brand_upper:
-        return 15
-    elif "DINERS" in brand_upper:
-        return random.choice([14, 16])
-    elif "DISCOVER" in brand_upper:
-        return random.choice([16, 19])
-    elif card_type and "PREPAID" in card_type.upper():
-        return 16
+    lengths = _brand_card_lengths(brand)
+    return lengths[0] if len(lengths) == 1 else _choice(lengths)
+
+# Digit sum of d * 2 for each digit d, indexed by the ASCII byte of d
+LUHN_DOUBLED = tuple([0] * 48 + [0, 2, 4, 6, 8, 1, 3, 5, 7, 9])
+LUHN_PLAIN = tuple([0] * 48 + list(range(10)))
+
+def _luhn_sum(digits: bytes, double_first: bool) -> int:
+    """Luhn sum over ASCII digits, walking from the right."""
+    reversed_digits = digits[::-1]
+    if double_first:
+        doubled, plain = reversed_digits[0::2], reversed_digits[1::2]
     else:
-        return 16  # Default for Visa, Mastercard, etc.
+        plain, doubled = reversed_digits[0::2], reversed_digits[1::2]
+    return sum(map(LUHN_DOUBLED.__getitem__, doubled)) + sum(map(LUHN_PLAIN.__getitem__, plain))
 
 def luhn_checksum(card_number: str) -> bool:
     """
     Validate card number using Luhn algorithm.
     """
-    def digits_of(n):
-        return [int(d) for d in str(n)]
-    
-    digits = digits_of(card_number)
-    odd_digits = digits[-1::-2]
-    even_digits = digits[-2::-2]
-    checksum = sum(odd_digits)
-    
-    for d in even_digits:
-        checksum += sum(digits_of(d * 2))
-    
-    return checksum % 10 == 0
+    return _luhn_sum(card_number.encode(), double_first=False) % 10 == 0
+
+def luhn_check_digit(partial_number: str) -> str:
+    """
+    Compute the Luhn check digit to append to `partial_number`.
+    """
+    return str(-_luhn_sum(partial_number.encode(), double_first=True) % 10)
+
+def has_bad_triples(digits: List[int]) -> bool:
+    """
+    True if any three consecutive digits are identical, ascending or descending.
+    """
+    for i in range(len(digits) - 2):
+        a, b, c = digits[i], digits[i + 1], digits[i + 2]
+        step = b - a
+        if -1 <= step <= 1 and c - b == step:
+            return True
+    return False
 
 def create_card_number(bin_prefix: str, bin_info: BinData = None) -> str:
     """
@@ -99,104 +195,68 @@ def create_card_number(bin_prefix: str, bin_info: BinData = None) -> str:
     card_type = bin_info.type if bin_info else ""
     target_length = get_card_length(brand, card_type)
     
+    # Compiled path when numba is installed
+    if NATIVE_AVAILABLE and bin_prefix.isdigit():
+        prefix_digits = np.frombuffer(bin_prefix.encode(), dtype=np.uint8).astype(np.int64) - 48
+        return digits_to_str(generate_card_digits(prefix_digits, target_length))
+    
     # Start with BIN prefix
     bin_len = len(bin_prefix)
     remaining_digits = target_length - bin_len - 1  # -1 for check digit
     
     # Weighted digit generation (favors 0-5)
-    weights = [2, 2, 2, 2, 2, 2, 1, 1, 1, 1]  # 0-5 have weight 2, 6-9 have weight 1
-    digit_choices = list(range(10))
+    choice = _choice
+    weighted_digits = _WEIGHTED_DIGITS
     
     max_attempts = 100
     for _ in range(max_attempts):
         # Generate random digits with weighted distribution
         random_digits = []
-        digit_counts = {i: 0 for _ in range(10)}
+        digit_counts = [0] * 10
         
         for _ in range(remaining_digits):
-            digit = random.choices(digit_choices, weights=weights)[0]
+            digit = choice(weighted_digits)
             # Limit each digit to max 2 occurrences
             if digit_counts[digit] < 2:
                 random_digits.append(digit)
                 digit_counts[digit] += 1
             else:
-                # Find alternative digit
-                alternatives = [d for d in digit_choices if digit_counts[d] < 2]
+                # Find alternative digit, keeping the weighting
+                alternatives = [d for d in weighted_digits if digit_counts[d] < 2]
                 if alternatives:
-                    alt_digit = random.choices(alternatives, 
-                                             weights=[weights[d] for d in alternatives])[0]
+                    alt_digit = choice(alternatives)
                     random_digits.append(alt_digit)
                     digit_counts[alt_digit] += 1
                 else:
-                    random_digits.append(random.choice(digit_choices))
-        
-        # Create number without check digit
-        partial_number = bin_prefix + ''.join(map(str, random_digits))
-        
-        # Advanced pattern filtering
-        digit_str = ''.join(map(str, random_digits))
+                    random_digits.append(random.randrange(10))
         
-        # Check for 3 consecutive identical digits
-        has_three_identical = any(
-            digit_str[i] == digit_str[i+1] == digit_str[i+2]
-            for _ in range(len(digit_str) - 2)
-        )
-        
-        # Check for 3 consecutive ascending
-        has_ascending = any(
-            int(digit_str[i]) + 1 == int(digit_str[i+1]) and 
-            int(digit_str[i+1]) + 1 == int(digit_str[i+2])
-            for _ in range(len(digit_str) - 2)
-        )
-        
-        # Check for 3 consecutive descending
-        has_descending = any(
-            int(digit_str[i]) - 1 == int(digit_str[i+1]) and 
-            int(digit_str[i+1]) - 1 == int(digit_str[i+2])
-            for _ in range(len(digit_str) - 2)
-        )
-        
-        # If patterns are acceptable, calculate check digit
-        if not (has_three_identical or has_ascending or has_descending):
-            # Calculate Luhn check digit
-            for check_digit in range(10):
-                full_number = partial_number + str(check_digit)
-                if luhn_checksum(full_number):
-                    return full_number
+        # Advanced pattern filtering: reject identical, ascending or descending runs of 3
+        if not has_bad_triples(random_digits):
+            # Create number and append Luhn check digit
+            partial_number = bin_prefix + ''.join(map(str, random_digits))
+            return partial_number + luhn_check_digit(partial_number)
     
     # Fallback: simple random generation if advanced fails
     remaining_digits = target_length - bin_len - 1
     random_part = ''.join([str(random.randint(0, 9)) for _ in range(remaining_digits)])
     partial_number = bin_prefix + random_part
     
-    for check_digit in range(10):
-        full_number = partial_number + str(check_digit)
-        if luhn_checksum(full_number):
-            return full_number
-    
-    return partial_number + "0"  # Final fallback
+    return partial_number + luhn_check_digit(partial_number)
 
 def generate_cvv(card_number: str, expiry: Optional[str] = None, seed: bool = True) -> str:
     """
     Generate CVV with optional seeding.
     """
-    # Determine CVV length based on card number
-    if card_number.startswith(('34', '37')):  # American Express
-        cvv_length = 4
-    else:
-        cvv_length = 3
+    # Determine CVV length based on card number (4 for American Express)
+    cvv_length = 4 if card_number[:2] in AMEX_PREFIXES else 3
     
     if seed and expiry:
-        # Seeded CVV using SHA256
-        seed_string = f"{card_number}{expiry}"
-        hash_digest = hashlib.sha256(seed_string.encode()).hexdigest()
-        # Use first digits of hash for CVV
-        cvv = ''.join([c for c in hash_digest if c.isdigit()])[:cvv_length]
-        if len(cvv) == cvv_length:
-            return cvv
+        # Seeded CVV: reduce the SHA256 digest to cvv_length decimal digits
+        seed_bytes = f"{card_number}{expiry}".encode()
+        value = int.from_bytes(hashlib.sha256(seed_bytes).digest()[:8], "big") % 10 ** cvv_length
+        return f"{value:0{cvv_length}d}"
     
-    # Fallback to random generation
-    return ''.join([str(random.randint(0, 9)) for _ in range(cvv_length)])
+    return f"{random.randrange(10 ** cvv_length):0{cvv_length}d}"
 
 def generate_expiry(card_type: Optional[str] = None) -> str:
     """
@@ -219,19 +279,15 @@ def generate_avs_postal_code(country_code: str) -> Optional[str]:
     """
     Generate realistic postal code for AVS testing.
     """
-    if country_code.upper() in AVS_POSTAL_CODES:
-        return random.choice(AVS_POSTAL_CODES[country_code.upper()])
-    return None
+    codes = _AVS_CHOICES.get(country_code.upper())
+    return _choice(codes) if codes else None
 
 def format_card_display(number: str, cvv: str, expiry: str, bin_info: BinData = None, postal_code: Optional[str] = None) -> Dict:
     """
     Format card information for display.
     """
     # Format card number with spaces
-    if len(number) == 15:  # American Express
-        formatted_number = f"{number[:4]} {number[4:10]} {number[10:]}"
-    else:  # 16+ digit cards
-        formatted_number = ' '.join([number[i:i+4] for _ in range(0, len(number), 4)])
+    formatted_number = CARD_DISPLAY_FORMATS.get(len(number), _group_by_four)(number)
     
     card_data = {
         "number": formatted_number,
@@ -268,17 +324,57 @@ async def generate_test_card(
     if not is_valid:
         raise ValueError(message)
     
+    avs_country = _check_avs_country(include_avs, avs_country)
+    return _build_test_card(bin_input, bin_data, avs_country)
+
+# Cards generated per worker thread by generate_test_cards
+CARDS_PER_WORKER = 25
+
+async def generate_test_cards(
+    bin_input: str,
+    db: Session,
+    count: int,
+    include_avs: bool = False,
+    avs_country: Optional[str] = None
+) -> List[Dict]:
+    """
+    Generate a batch of test cards for one BIN.
+    
+    The BIN is validated once; generation is split into chunks of
+    CARDS_PER_WORKER that run concurrently in worker threads (the compiled
+    generator releases the GIL).
+    """
+    is_valid, message, bin_data = validate_bin(bin_input, db)
+    if not is_valid:
+        raise ValueError(message)
+    
+    avs_country = _check_avs_country(include_avs, avs_country)
+    chunks = await asyncio.gather(*[
+        asyncio.to_thread(_build_test_cards, bin_input, bin_data, avs_country, min(CARDS_PER_WORKER, count - start))
+        for start in range(0, count, CARDS_PER_WORKER)
+    ])
+    return [card for chunk in chunks for card in chunk]
+
+def _check_avs_country(include_avs: bool, avs_country: Optional[str]) -> Optional[str]:
+    """Return the AVS country to generate postal codes for, or None."""
+    if not (include_avs and avs_country):
+        return None
+    if avs_country.upper() not in _AVS_CHOICES:
+        raise ValueError(f"AVS not supported for country: {avs_country}")
+    return avs_country
+
+def _build_test_card(bin_input: str, bin_data: Optional[BinRecord], avs_country: Optional[str]) -> Dict:
+    """Generate and format one card for an already validated BIN."""
     # Generate card components
     card_number = create_card_number(bin_input, bin_data)
     expiry = generate_expiry(bin_data.type if bin_data else None)
     cvv = generate_cvv(card_number, expiry, seed=True)
     
     # Generate postal code if AVS requested
-    postal_code = None
-    if include_avs and avs_country:
-        postal_code = generate_avs_postal_code(avs_country)
-        if not postal_code:
-            raise ValueError(f"AVS not supported for country: {avs_country}")
+    postal_code = generate_avs_postal_code(avs_country) if avs_country else None
     
     # Format and return card data
     return format_card_display(card_number, cvv, expiry, bin_data, postal_code)
+
+def _build_test_cards(bin_input: str, bin_data: Optional[BinRecord], avs_country: Optional[str], count: int) -> List[Dict]:
+    return [_build_test_card(bin_input, bin_data, avs_country) for _ in range(count)]
@@ -1,12 +1,39 @@
-import requests
+import asyncio
+import httpx
 import hashlib
-import hmac
 import json
-from typing import Dict, Optional
+import orjson
+from typing import Dict, Optional, Tuple
 from datetime import datetime, timedelta
 import os
-from coinbase_commerce.client import Client
-from coinbase_commerce.webhook import Webhook
+import time
+
+from app.utils.signatures import verify_hmac_signature
+
+# The NOWPayments currency list changes on the order of days
+CURRENCIES_CACHE_SECONDS = 21600
+
+COINBASE_API_URL = "https://api.commerce.coinbase.com"
+COINBASE_API_VERSION = "2018-03-22"
+
+def _create_api_client(base_url: str, headers: Dict[str, str]) -> httpx.AsyncClient:
+    """
+    Shared keep-alive client for a payment provider API.
+    
+    Connection failures are retried twice by the transport; requests that
+    reached the provider are never replayed, so payments are not duplicated.
+    """
+    # Bodies are encoded with orjson and sent as content=, so the JSON
+    # Content-Type must come from the default headers
+    return httpx.AsyncClient(
+        base_url=base_url,
+        headers=headers,
+        timeout=10.0,
+        transport=httpx.AsyncHTTPTransport(
+            retries=2,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=100)
+        )
+    )
 
 class NOWPaymentsService:
     """NOWPayments API integration for crypto payments."""
@@ -18,6 +45,16 @@ class NOWPaymentsService:
         
         if not self.api_key:
             raise ValueError("NOWPAYMENTS_API_KEY not found in environment")
+        
+        self._client = _create_api_client(self.base_url, self.get_headers())
+        
+        # (fetched_at, currencies); the lock lets one caller refresh while others wait
+        self._currencies_cache: Optional[Tuple[float, list]] = None
+        self._currencies_lock = asyncio.Lock()
+    
+    async def aclose(self):
+        """Close pooled connections."""
+        await self._client.aclose()
     
     def get_headers(self) -> Dict[str, str]:
         return {
@@ -25,33 +62,47 @@ class NOWPaymentsService:
             "Content-Type": "application/json"
         }
     
+    def _fresh_currencies(self) -> Optional[list]:
+        if self._currencies_cache and time.monotonic() - self._currencies_cache[0] < CURRENCIES_CACHE_SECONDS:
+            return self._currencies_cache[1]
+        return None
+    
     async def get_available_currencies(self) -> list:
-        """Get list of available cryptocurrencies."""
-        try:
-            response = requests.get(
-                f"{self.base_url}/currencies",
-                headers=self.get_headers()
-            )
-            response.raise_for_status()
-            return response.json().get("currencies", [])
-        except Exception as e:
-            print(f"Error fetching currencies: {e}")
-            return ["btc", "eth", "usdt", "ltc", "bch"]  # Fallback popular currencies
+        """Get list of available cryptocurrencies (cached for CURRENCIES_CACHE_SECONDS)."""
+        currencies = self._fresh_currencies()
+        if currencies is not None:
+            return currencies
+        
+        async with self._currencies_lock:
+            # Another caller may have refreshed the list while we waited
+            currencies = self._fresh_currencies()
+            if currencies is not None:
+                return currencies
+            
+            try:
+                response = await self._client.get("/currencies")
+                response.raise_for_status()
+                currencies = orjson.loads(response.content).get("currencies", [])
+            except Exception as e:
+                print(f"Error fetching currencies: {e}")
+                return ["btc", "eth", "usdt", "ltc", "bch"]  # Fallback popular currencies
+            
+            self._currencies_cache = (time.monotonic(), currencies)
+            return currencies
     
     async def get_estimate(self, amount_usd: float, currency: str) -> Optional[Dict]:
         """Get cryptocurrency amount estimate for USD price."""
         try:
-            response = requests.get(
-                f"{self.base_url}/estimate",
+            response = await self._client.get(
+                "/estimate",
                 params={
                     "amount": amount_usd,
                     "currency_from": "usd",
                     "currency_to": currency.lower()
-                },
-                headers=self.get_headers()
+                }
             )
             response.raise_for_status()
-            return response.json()
+            return orjson.loads(response.content)
         except Exception as e:
             print(f"Error getting estimate for {currency}: {e}")
             return None
@@ -79,13 +130,9 @@ class NOWPaymentsService:
                 "customer_email": user_email
             }
             
-            response = requests.post(
-                f"{self.base_url}/payment",
-                json=payload,
-                headers=self.get_headers()
-            )
+            response = await self._client.post("/payment", content=orjson.dumps(payload))
             response.raise_for_status()
-            return response.json()
+            return orjson.loads(response.content)
             
         except Exception as e:
             print(f"Error creating payment: {e}")
@@ -96,23 +143,14 @@ class NOWPaymentsService:
         if not self.ipn_secret:
             return False
         
-        expected_signature = hmac.new(
-            self.ipn_secret.encode(),
-            payload,
-            hashlib.sha512
-        ).hexdigest()
-        
-        return hmac.compare_digest(signature, expected_signature)
+        return verify_hmac_signature(self.ipn_secret.encode(), payload, signature, hashlib.sha512)
     
     async def get_payment_status(self, payment_id: str) -> Optional[Dict]:
         """Get payment status."""
         try:
-            response = requests.get(
-                f"{self.base_url}/payment/{payment_id}",
-                headers=self.get_headers()
-            )
+            response = await self._client.get(f"/payment/{payment_id}")
             response.raise_for_status()
-            return response.json()
+            return orjson.loads(response.content)
         except Exception as e:
             print(f"Error getting payment status: {e}")
             return None
@@ -128,7 +166,15 @@ class CoinbaseCommerceService:
         if not self.api_key:
             raise ValueError("COINBASE_API_KEY not found in environment")
         
-        self.client = Client(api_key=self.api_key)
+        self._client = _create_api_client(COINBASE_API_URL, {
+            "X-CC-Api-Key": self.api_key,
+            "X-CC-Version": COINBASE_API_VERSION,
+            "Content-Type": "application/json"
+        })
+    
+    async def aclose(self):
+        """Close pooled connections."""
+        await self._client.aclose()
     
     async def create_charge(
         self, 
@@ -158,12 +204,14 @@ class CoinbaseCommerceService:
                 "cancel_url": cancel_url
             }
             
-            charge = self.client.charge.create(**charge_data)
+            response = await self._client.post("/charges", content=orjson.dumps(charge_data))
+            response.raise_for_status()
+            charge = orjson.loads(response.content)["data"]
             return {
-                "id": charge.id,
-                "hosted_url": charge.hosted_url,
-                "expires_at": charge.expires_at,
-                "pricing": charge.pricing
+                "id": charge["id"],
+                "hosted_url": charge["hosted_url"],
+                "expires_at": charge["expires_at"],
+                "pricing": charge["pricing"]
             }
             
         except Exception as e:
@@ -171,24 +219,28 @@ class CoinbaseCommerceService:
             return None
     
     def verify_webhook_signature(self, payload: bytes, signature: str) -> bool:
-        """Verify webhook signature."""
-        if not self.webhook_secret:
-            return False
+        """
+        Verify the X-CC-Webhook-Signature header: hex HMAC-SHA256 of the raw body.
         
-        try:
-            return Webhook.verify_signature(payload, signature, self.webhook_secret)
-        except Exception:
+        Checked here rather than through the SDK so the comparison is always
+        constant time (hmac.compare_digest on equal-length digests).
+        """
+        if not self.webhook_secret or not signature:
             return False
+        
+        return verify_hmac_signature(self.webhook_secret.encode(), payload, signature)
     
     async def get_charge(self, charge_id: str) -> Optional[Dict]:
         """Get charge details."""
         try:
-            charge = self.client.charge.retrieve(charge_id)
+            response = await self._client.get(f"/charges/{charge_id}")
+            response.raise_for_status()
+            charge = orjson.loads(response.content)["data"]
             return {
-                "id": charge.id,
-                "code": charge.code,
-                "timeline": charge.timeline,
-                "payments": charge.payments
+                "id": charge["id"],
+                "code": charge["code"],
+                "timeline": charge["timeline"],
+                "payments": charge["payments"]
             }
         except Exception as e:
             print(f"Error getting charge: {e}")
@@ -214,6 +266,21 @@ class CryptoPaymentManager:
             "dot": {"name": "Polkadot", "symbol": "DOT", "provider": "nowpayments"},
             "matic": {"name": "Polygon", "symbol": "MATIC", "provider": "nowpayments"}
         }
+        
+        # Provider routing resolved once: NOWPayments is preferred for broader
+        # support, and currencies offered by both can fall back to Coinbase
+        self._auto_provider = {
+            currency: "nowpayments" if info["provider"] == "both" else info["provider"]
+            for currency, info in self.supported_currencies.items()
+        }
+        self._coinbase_fallback = frozenset(
+            currency for currency, info in self.supported_currencies.items()
+            if info["provider"] == "both"
+        )
+    
+    async def aclose(self):
+        """Close provider API connections."""
+        await asyncio.gather(self.nowpayments.aclose(), self.coinbase.aclose())
     
     async def get_available_currencies(self) -> Dict[str, Dict]:
         """Get all available cryptocurrencies."""
@@ -234,16 +301,13 @@ class CryptoPaymentManager:
         """
         currency_lower = currency.lower()
         
-        if currency_lower not in self.supported_currencies:
+        auto_provider = self._auto_provider.get(currency_lower)
+        if auto_provider is None:
             raise ValueError(f"Unsupported currency: {currency}")
         
         # Auto-select provider if not specified
         if provider == "auto":
-            currency_info = self.supported_currencies[currency_lower]
-            if currency_info["provider"] == "both":
-                provider = "nowpayments"  # Prefer NOWPayments for broader support
-            else:
-                provider = currency_info["provider"]
+            provider = auto_provider
         
         try:
             if provider == "nowpayments":
@@ -261,7 +325,7 @@ class CryptoPaymentManager:
             print(f"Error creating payment with {provider}: {e}")
             
             # Fallback to alternative provider
-            if provider == "nowpayments" and self.supported_currencies[currency_lower]["provider"] == "both":
+            if provider == "nowpayments" and currency_lower in self._coinbase_fallback:
                 print("Falling back to Coinbase Commerce...")
                 return await self.coinbase.create_charge(
                     amount_usd, order_id, user_email, success_url, cancel_url
@@ -6,11 +6,66 @@ Provides high-performance BIN lookup using Cloudflare D1 global database
 import httpx
 import os
 import json
+import orjson
+import re
 from typing import Optional, Dict, Any, List
 from fastapi import HTTPException
 import asyncio
 from datetime import datetime
 
+from app.utils.cache import async_ttl_cache
+
+# Parameterized statements: D1 binds the ? values, so user input never
+# becomes SQL text and each statement's plan can be reused
+# Exact 6-digit match, falling back to the first BIN sharing the 4-digit
+# prefix, resolved in a single round trip
+BIN_LOOKUP_SQL = """
+        SELECT * FROM (SELECT 0 AS match_rank, * FROM bins WHERE bin = ?1 LIMIT 1)
+        UNION ALL
+        SELECT * FROM (SELECT 1 AS match_rank, * FROM bins WHERE bin LIKE ?2 ORDER BY bin LIMIT 1)
+        ORDER BY match_rank
+        LIMIT 1;
+        """
+BIN_SEARCH_SQL = """
+        SELECT * FROM bins 
+        WHERE bin LIKE ?1 
+           OR UPPER(brand) LIKE ?1
+           OR UPPER(issuer) LIKE ?1
+           OR UPPER(country) LIKE ?1
+           OR UPPER(type) LIKE ?1
+        ORDER BY bin 
+        LIMIT ?2;
+        """
+POPULAR_BRANDS_SQL = """
+        SELECT brand, COUNT(*) as count
+        FROM bins 
+        WHERE brand IS NOT NULL AND brand != ''
+        GROUP BY brand 
+        ORDER BY count DESC 
+        LIMIT ?;
+        """
+
+# Cache lifetimes: BIN rows change weekly at most, aggregates change slowly
+BIN_CACHE_SECONDS = 3600
+SEARCH_CACHE_SECONDS = 300
+STATS_CACHE_SECONDS = 21600
+
+# Everything that is not an ASCII digit, stripped from BIN input
+NON_DIGITS = re.compile(r"[^0-9]+")
+
+# Output field -> (row column, default when empty, title-case the value)
+BIN_RESULT_FIELDS = (
+    ("bin", "bin", "", False),
+    ("brand", "brand", "Unknown", True),
+    ("type", "type", "Unknown", True),
+    ("category", "category", "Standard", True),
+    ("issuer", "issuer", "Unknown", True),
+    ("country", "country", "Unknown", True),
+    ("country_name", "country", "Unknown", True),
+    ("bank_phone", "bank_phone", "", False),
+    ("bank_url", "bank_url", "", False),
+)
+
 class CloudflareD1Service:
     """Service for interacting with Cloudflare D1 database"""
     
@@ -19,40 +74,49 @@ class CloudflareD1Service:
         self.database_id = os.getenv("CLOUDFLARE_D1_DATABASE_ID", "e8e3af39-17e0-4c36-bebe-efe510a973af")
         self.api_token = os.getenv("CLOUDFLARE_API_TOKEN")
         
+        # Lookups in flight, keyed by cleaned BIN prefix, shared by concurrent callers
+        self._inflight: Dict[str, asyncio.Task] = {}
+        
         if not self.account_id or not self.api_token:
             print("⚠️ Warning: Cloudflare D1 credentials not configured. Using fallback SQLite.")
             self.enabled = False
         else:
             self.enabled = True
             self.base_url = f"https://api.cloudflare.com/client/v4/accounts/{self.account_id}/d1/database/{self.database_id}"
+            # One keep-alive client for the service lifetime, so the TLS
+            # connection to Cloudflare is reused across queries
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={
+                    "Authorization": f"Bearer {self.api_token}",
+                    "Content-Type": "application/json"
+                },
+                timeout=10.0,
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=100)
+            )
+    
+    async def aclose(self):
+        """Close the pooled D1 connections"""
+        if self.enabled:
+            await self._client.aclose()
             
-    async def _execute_query(self, sql: str) -> Optional[Dict]:
+    async def _execute_query(self, sql: str, params: Optional[List[Any]] = None) -> Optional[Dict]:
         """Execute SQL query against D1 database"""
         if not self.enabled:
             return None
             
-        headers = {
-            "Authorization": f"Bearer {self.api_token}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {"sql": sql}
+        payload = {"sql": sql, "params": params or []}
         
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/query",
-                    headers=headers,
-                    json=payload
-                )
+            response = await self._client.post("/query", content=orjson.dumps(payload))
+            
+            if response.status_code == 200:
+                result = orjson.loads(response.content)
+                return result.get('result', [{}])[0] if result.get('result') else None
+            else:
+                print(f"D1 query failed: {response.status_code} - {response.text}")
+                return None
                 
-                if response.status_code == 200:
-                    result = response.json()
-                    return result.get('result', [{}])[0] if result.get('result') else None
-                else:
-                    print(f"D1 query failed: {response.status_code} - {response.text}")
-                    return None
-                    
         except Exception as e:
             print(f"D1 connection error: {e}")
             return None
@@ -71,27 +135,29 @@ class CloudflareD1Service:
             return None
             
         # Clean input
-        bin_clean = ''.join(filter(str.isdigit, bin_number))[:8]
+        bin_clean = NON_DIGITS.sub('', bin_number)[:8]
         if len(bin_clean) < 4:
             return None
         
-        # Try exact match first (6-digit BIN)
+        # Concurrent lookups of the same BIN share one D1 request; shield it so
+        # a cancelled caller does not cancel the lookup for the others
         bin_prefix = bin_clean[:6]
-        sql = f"SELECT * FROM bins WHERE bin = '{bin_prefix}' LIMIT 1;"
-        
-        result = await self._execute_query(sql)
+        task = self._inflight.get(bin_prefix)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_bin(bin_prefix))
+            self._inflight[bin_prefix] = task
+            task.add_done_callback(lambda _: self._inflight.pop(bin_prefix, None))
+        # The cached dict is shared by every caller; hand out a copy
+        result = await asyncio.shield(task)
+        return dict(result) if result else None
+    
+    @async_ttl_cache(BIN_CACHE_SECONDS, maxsize=100_000)
+    async def _fetch_bin(self, bin_prefix: str) -> Optional[Dict[str, Any]]:
+        """Exact match first (6-digit BIN), else 4-digit prefix match"""
+        result = await self._execute_query(BIN_LOOKUP_SQL, [bin_prefix, f"{bin_prefix[:4]}%"])
         if result and result.get('results'):
             return self._format_bin_result(result['results'][0])
         
-        # Fallback to 4-digit prefix match
-        if len(bin_clean) >= 4:
-            bin_4digit = bin_clean[:4]
-            sql = f"SELECT * FROM bins WHERE bin LIKE '{bin_4digit}%' ORDER BY bin LIMIT 1;"
-            
-            result = await self._execute_query(sql)
-            if result and result.get('results'):
-                return self._format_bin_result(result['results'][0])
-        
         return None
     
     async def search_bins(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
@@ -108,31 +174,33 @@ class CloudflareD1Service:
         if not self.enabled:
             return []
             
-        query_clean = query.strip().upper()
-        
-        # Build search SQL
-        sql = f"""
-        SELECT * FROM bins 
-        WHERE bin LIKE '%{query_clean}%' 
-           OR UPPER(brand) LIKE '%{query_clean}%'
-           OR UPPER(issuer) LIKE '%{query_clean}%'
-           OR UPPER(country) LIKE '%{query_clean}%'
-           OR UPPER(type) LIKE '%{query_clean}%'
-        ORDER BY bin 
-        LIMIT {min(limit, 50)};
-        """
-        
-        result = await self._execute_query(sql)
+        rows = await self._search_bins(query.strip().upper(), min(limit, 50))
+        return [dict(row) for row in rows]
+    
+    @async_ttl_cache(SEARCH_CACHE_SECONDS, maxsize=1024)
+    async def _search_bins(self, query_clean: str, limit: int) -> List[Dict[str, Any]]:
+        result = await self._execute_query(BIN_SEARCH_SQL, [f"%{query_clean}%", limit])
         if result and result.get('results'):
-            return [self._format_bin_result(row) for row in result['results']]
+            now_iso = datetime.utcnow().isoformat()
+            return [self._format_bin_result(row, now_iso) for row in result['results']]
         
         return []
     
+    def invalidate(self, bin_prefix: str):
+        """Drop a cached BIN lookup and all cached searches, e.g. after an admin edit"""
+        CloudflareD1Service._fetch_bin.cache_invalidate(self, bin_prefix[:6])
+        CloudflareD1Service._search_bins.cache_clear()
+    
     async def get_database_stats(self) -> Dict[str, Any]:
         """Get database statistics"""
         if not self.enabled:
             return {"error": "D1 not enabled"}
-            
+        
+        stats = await self._fetch_database_stats()
+        return dict(stats) if stats else {"error": "Failed to get stats"}
+    
+    @async_ttl_cache(STATS_CACHE_SECONDS)
+    async def _fetch_database_stats(self) -> Optional[Dict[str, Any]]:
         stats_sql = """
         SELECT 
             COUNT(*) as total_records,
@@ -147,43 +215,33 @@ class CloudflareD1Service:
         if result and result.get('results'):
             return result['results'][0]
         
-        return {"error": "Failed to get stats"}
+        return None
     
+    @async_ttl_cache(STATS_CACHE_SECONDS)
     async def get_popular_brands(self, limit: int = 10) -> List[Dict[str, Any]]:
-        """Get most popular card brands"""
+        """Get most popular card brands (cached list is shared; treat as read-only)"""
         if not self.enabled:
             return []
             
-        sql = f"""
-        SELECT brand, COUNT(*) as count
-        FROM bins 
-        WHERE brand IS NOT NULL AND brand != ''
-        GROUP BY brand 
-        ORDER BY count DESC 
-        LIMIT {limit};
-        """
-        
-        result = await self._execute_query(sql)
+        result = await self._execute_query(POPULAR_BRANDS_SQL, [limit])
         if result and result.get('results'):
             return result['results']
         
         return []
     
-    def _format_bin_result(self, row: Dict) -> Dict[str, Any]:
+    def _format_bin_result(self, row: Dict, now_iso: Optional[str] = None) -> Dict[str, Any]:
         """Format database row to standard BIN result format"""
-        return {
-            "bin": row.get("bin", ""),
-            "brand": row.get("brand", "Unknown").title() if row.get("brand") else "Unknown",
-            "type": row.get("type", "Unknown").title() if row.get("type") else "Unknown",
-            "category": row.get("category", "Standard").title() if row.get("category") else "Standard",
-            "issuer": row.get("issuer", "Unknown").title() if row.get("issuer") else "Unknown",
-            "country": row.get("country", "Unknown").title() if row.get("country") else "Unknown",
-            "country_name": row.get("country", "Unknown").title() if row.get("country") else "Unknown",
-            "bank_phone": row.get("bank_phone", "") or "",
-            "bank_url": row.get("bank_url", "") or "",
-            "source": "cloudflare_d1",
-            "updated_at": datetime.utcnow().isoformat()
-        }
+        result = {}
+        for field, column, default, titlecase in BIN_RESULT_FIELDS:
+            value = row.get(column)
+            if not value:
+                value = default
+            elif titlecase and isinstance(value, str):
+                value = value.title()
+            result[field] = value
+        result["source"] = "cloudflare_d1"
+        result["updated_at"] = now_iso or datetime.utcnow().isoformat()
+        return result
 
 # Global instance
 d1_service = CloudflareD1Service()
@@ -2,15 +2,17 @@
 Premium Features Service for BIN Search Pro
 """
 
-from typing import Dict, List, Optional, Any
+from types import MappingProxyType
+from typing import Dict, Iterator, List, Mapping, Optional, Union, Any
 from sqlalchemy.orm import Session
 from datetime import datetime
-import json
+import orjson
 import csv
 import io
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
-import random
+import secrets
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
 
 from app.models import User, UserTier, BinData, UsageLog, ActionType, Subscription, SubscriptionStatus
 from app.services.card_generator import (
@@ -18,11 +20,28 @@ from app.services.card_generator import (
     AVS_POSTAL_CODES, get_card_length
 )
 
+# Per-tier limits; read-only views so callers cannot mutate the shared constants
+PREMIUM_RATE_LIMITS = MappingProxyType({
+    "card_generation": 1000,
+    "bin_lookup": 10000,
+    "bulk_generation": 100,
+    "export": 50,
+    "avs_generation": 1000
+})
+FREE_RATE_LIMITS = MappingProxyType({
+    "card_generation": 5,
+    "bin_lookup": 10,
+    "bulk_generation": 0,
+    "export": 0,
+    "avs_generation": 0
+})
+
 class PremiumFeaturesService:
     """Service for managing premium features."""
     
     def __init__(self):
         self.premium_tiers = [UserTier.PREMIUM, UserTier.API]
+        self._premium_tier_values = frozenset(tier.value for tier in self.premium_tiers)
     
     def is_user_premium(self, user: Optional[User], db: Session) -> bool:
         """Check if user has active premium subscription."""
@@ -30,35 +49,29 @@ class PremiumFeaturesService:
             return False
         
         # For now, just check tier (can add subscription checks later)
-        return user.tier in [tier.value for tier in self.premium_tiers]
+        return user.tier in self._premium_tier_values
     
-    def get_rate_limits(self, user: Optional[User], db: Session) -> Dict[str, int]:
+    def get_rate_limits(self, user: Optional[User], db: Session) -> Mapping[str, int]:
         """Get rate limits based on user tier."""
-        if user and self.is_user_premium(user, db):
-            return {
-                "card_generation": 1000,
-                "bin_lookup": 10000,
-                "bulk_generation": 100,
-                "export": 50,
-                "avs_generation": 1000
-            }
-        else:
-            return {
-                "card_generation": 5,
-                "bin_lookup": 10,
-                "bulk_generation": 0,
-                "export": 0,
-                "avs_generation": 0
-            }
+        return self.rate_limits_for(self.is_user_premium(user, db))
+    
+    def rate_limits_for(self, is_premium: bool) -> Mapping[str, int]:
+        """Rate limits for a premium status the caller has already checked."""
+        return PREMIUM_RATE_LIMITS if is_premium else FREE_RATE_LIMITS
     
     async def enhanced_bin_lookup(
         self, 
         bin_input: str, 
         user: Optional[User], 
         db: Session,
-        include_extended_data: bool = False
+        include_extended_data: bool = False,
+        lookup_time: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Enhanced BIN lookup with premium features."""
+        """
+        Enhanced BIN lookup with premium features.
+        
+        Batch callers pass one `lookup_time` ISO timestamp for all lookups.
+        """
         is_valid, message, bin_data = validate_bin(bin_input, db)
         if not is_valid:
             return {"error": message, "valid": False}
@@ -74,7 +87,7 @@ class PremiumFeaturesService:
             "bank_phone": bin_data.bank_phone,
             "bank_url": bin_data.bank_url,
             "valid": True,
-            "lookup_time": datetime.utcnow().isoformat()
+            "lookup_time": lookup_time or datetime.utcnow().isoformat()
         }
         
         if self.is_user_premium(user, db) and include_extended_data:
@@ -104,73 +117,113 @@ class PremiumFeaturesService:
         cards = []
         postal_codes = AVS_POSTAL_CODES[country_code.upper()]
         
-        for _ in range(count):
+        # Draw expiry dates and postal codes for the whole batch at once, from a
+        # per-request generator seeded by the OS CSPRNG (no shared global state)
+        rng = np.random.default_rng(secrets.randbits(128))
+        current_year = datetime.now().year
+        exp_years = (rng.integers(current_year + 1, current_year + 9, size=count) % 100).tolist()
+        exp_months = rng.integers(1, 13, size=count).tolist()
+        postal_indexes = rng.integers(0, len(postal_codes), size=count).tolist()
+        
+        # Fields shared by every card in the batch
+        shared = {
+            "country_code": country_code.upper(),
+            "bin": bin_input,
+            "brand": bin_data.brand,
+            "issuer": bin_data.issuer,
+            "type": bin_data.type,
+            "country": bin_data.country_name,
+            "generated_at": datetime.utcnow().isoformat(),
+            "avs_enabled": True
+        }
+        
+        for exp_year, exp_month, postal_index in zip(exp_years, exp_months, postal_indexes):
             card_number = create_card_number(bin_input, bin_data)
-            current_year = datetime.now().year
-            exp_year = random.randint(current_year + 1, current_year + 8)
-            exp_month = random.randint(1, 12)
-            expiry = f"{exp_month:02d}/{str(exp_year)[2:]}"
+            expiry = f"{exp_month:02d}/{exp_year:02d}"
             cvv = generate_cvv(card_number, expiry, seed=True)
-            postal_code = random.choice(postal_codes)
             
-            card_info = {
+            cards.append({
                 "number": card_number,
                 "cvv": cvv,
                 "expiry": expiry,
-                "postal_code": postal_code,
-                "country_code": country_code.upper(),
-                "bin": bin_input,
-                "brand": bin_data.brand,
-                "issuer": bin_data.issuer,
-                "type": bin_data.type,
-                "country": bin_data.country_name,
-                "generated_at": datetime.utcnow().isoformat(),
-                "avs_enabled": True
-            }
-            
-            cards.append(card_info)
+                "postal_code": postal_codes[postal_index],
+                **shared
+            })
         
         return cards
     
-    def export_cards_json(self, cards: List[Dict[str, Any]]) -> str:
-        """Export cards in JSON format."""
-        return json.dumps({
-            "cards": cards,
+    def iter_cards_json(self, cards: List[Dict[str, Any]]) -> Iterator[bytes]:
+        """Yield a JSON export one card at a time, as UTF-8 bytes."""
+        header = orjson.dumps({
             "export_format": "json",
-            "exported_at": datetime.utcnow().isoformat(),
+            "exported_at": datetime.utcnow(),
             "count": len(cards)
-        }, indent=2)
+        })
+        yield header[:-1] + b',"cards":['
+        for index, card in enumerate(cards):
+            encoded = orjson.dumps(card, default=str)
+            yield b"," + encoded if index else encoded
+        yield b"]}"
     
-    def export_cards_csv(self, cards: List[Dict[str, Any]]) -> str:
-        """Export cards in CSV format."""
+    def iter_cards_csv(self, cards: List[Dict[str, Any]]) -> Iterator[str]:
+        """Yield a CSV export one row at a time, reusing a single line buffer."""
         if not cards:
-            return "No cards to export"
+            yield "No cards to export"
+            return
         
-        output = io.StringIO()
-        fieldnames = cards[0].keys()
-        writer = csv.DictWriter(output, fieldnames=fieldnames)
+        line = io.StringIO()
+        writer = csv.DictWriter(line, fieldnames=cards[0].keys())
         
         writer.writeheader()
         for card in cards:
             writer.writerow(card)
-        
-        return output.getvalue()
+            yield line.getvalue()
+            line.seek(0)
+            line.truncate()
     
-    def export_cards_xml(self, cards: List[Dict[str, Any]]) -> str:
-        """Export cards in XML format."""
-        root = ET.Element("cards")
-        root.set("count", str(len(cards)))
-        root.set("exported_at", datetime.utcnow().isoformat())
-        
+    def export_cards_json(self, cards: List[Dict[str, Any]]) -> str:
+        """Export cards in JSON format."""
+        return b"".join(self.iter_cards_json(cards)).decode()
+    
+    def export_cards_csv(self, cards: List[Dict[str, Any]]) -> str:
+        """Export cards in CSV format."""
+        return "".join(self.iter_cards_csv(cards))
+    
+    def iter_cards_xml(self, cards: List[Dict[str, Any]]) -> Iterator[str]:
+        """Yield an indented XML export one card at a time."""
+        yield (
+            f'<?xml version="1.0" ?>\n<cards count="{len(cards)}" '
+            f'exported_at={quoteattr(datetime.utcnow().isoformat())}>\n'
+        )
         for card in cards:
-            card_element = ET.SubElement(root, "card")
+            parts = ["  <card>\n"]
             for key, value in card.items():
-                elem = ET.SubElement(card_element, key)
-                elem.text = str(value) if value is not None else ""
+                text = escape(str(value)) if value is not None else ""
+                parts.append(f"    <{key}>{text}</{key}>\n")
+            parts.append("  </card>\n")
+            yield "".join(parts)
+        yield "</cards>\n"
+    
+    def export_cards_xml(self, cards: List[Dict[str, Any]]) -> str:
+        """Export cards in XML format."""
+        return "".join(self.iter_cards_xml(cards))
+    
+    def iter_export(
+        self, 
+        cards: List[Dict[str, Any]], 
+        export_format: str = "json"
+    ) -> Iterator[Union[str, bytes]]:
+        """Export cards in specified format as a stream of chunks."""
+        export_format = export_format.lower()
         
-        rough_string = ET.tostring(root, 'unicode')
-        reparsed = minidom.parseString(rough_string)
-        return reparsed.toprettyxml(indent="  ")
+        if export_format == "json":
+            return self.iter_cards_json(cards)
+        elif export_format == "csv":
+            return self.iter_cards_csv(cards)
+        elif export_format == "xml":
+            return self.iter_cards_xml(cards)
+        else:
+            raise ValueError(f"Unsupported export format: {export_format}")
     
     def export_cards(
         self, 
@@ -3,15 +3,62 @@ Enhanced Rate Limiting Service for BIN Search Pro API
 Implements sliding window rate limiting with Redis backend and memory fallback.
 """
 
+import asyncio
+import logging
 import time
-import json
+import zlib
 from typing import Dict, Any, Optional, Tuple
-from datetime import datetime
-from collections import defaultdict
 
+import orjson
 import redis
 from fastapi import Request, HTTPException, status
 
+logger = logging.getLogger(__name__)
+
+
+# Spike protection looks at the last minute regardless of the action's window
+BURST_WINDOW = 60
+
+# Violations reset after an hour without new ones
+VIOLATION_TTL = 3600
+
+# Pending violation log entries; new ones are dropped while the queue is full
+VIOLATION_LOG_QUEUE_SIZE = 10000
+
+# Two-counter sliding window: each window keeps a single counter and the
+# count is approximated as current + previous * (share of previous window
+# still inside the sliding window). Checks both the main and burst windows and
+# either admits the request or records a violation in one atomic round trip.
+# KEYS: current, previous, burst_current, burst_previous, violation_key
+# ARGV: window, limit, weight, burst_window, burst_limit, burst_weight, violation_ttl
+# Returns: {allowed, count, burst_count, violations}
+RATE_LIMIT_LUA = """
+local function weighted_count(current_key, previous_key, weight)
+    local current = tonumber(redis.call('GET', current_key) or '0')
+    local previous = tonumber(redis.call('GET', previous_key) or '0')
+    return math.floor(current + previous * weight)
+end
+local count = weighted_count(KEYS[1], KEYS[2], tonumber(ARGV[3]))
+local burst_count = weighted_count(KEYS[3], KEYS[4], tonumber(ARGV[6]))
+if count >= tonumber(ARGV[2]) or burst_count >= tonumber(ARGV[5]) then
+    local violations = redis.call('INCR', KEYS[5])
+    redis.call('EXPIRE', KEYS[5], tonumber(ARGV[7]))
+    return {0, count, burst_count, violations}
+end
+if redis.call('INCR', KEYS[1]) == 1 then
+    redis.call('EXPIRE', KEYS[1], 2 * tonumber(ARGV[1]))
+end
+if redis.call('INCR', KEYS[3]) == 1 then
+    redis.call('EXPIRE', KEYS[3], 2 * tonumber(ARGV[4]))
+end
+return {1, count, burst_count, 0}
+"""
+
+
+def _previous_window_weight(now: float, window: int) -> float:
+    """Share of the previous fixed window still covered by the sliding window."""
+    return 1 - (now % window) / window
+
 
 class EnhancedRateLimiter:
     """
@@ -22,18 +69,26 @@ class EnhancedRateLimiter:
     def __init__(self, redis_url: Optional[str] = None):
         # Redis client setup
         self.redis_client = None
+        self._rate_limit_sha = None
+        # Violation log queue and its consumer, created on first use because
+        # the module-level limiter is built before the event loop starts
+        self._log_queue: Optional[asyncio.Queue] = None
+        self._log_consumer: Optional[asyncio.Task] = None
         if redis_url:
             try:
                 self.redis_client = redis.from_url(redis_url, decode_responses=True)
                 # Test connection
                 self.redis_client.ping()
+                self._rate_limit_sha = self.redis_client.script_load(RATE_LIMIT_LUA)
                 print("✅ Connected to Redis for rate limiting")
             except Exception as e:
                 print(f"⚠️ Redis connection failed: {e}. Using memory fallback.")
                 self.redis_client = None
         
-        # Memory fallback store
-        self.memory_store: Dict[str, Any] = defaultdict(list)
+        # Memory fallback stores: (window_id, current, previous) counters, and
+        # (count, expires_at) violation counts mirroring VIOLATION_TTL
+        self._window_counters: Dict[str, Tuple[int, int, int]] = {}
+        self._violation_counts: Dict[str, Tuple[int, float]] = {}
         
         # Rate limit configurations (requests per window in seconds)
         self.rate_limits = {
@@ -55,22 +110,41 @@ class EnhancedRateLimiter:
             5: 16.0    # 16 minutes
         }
     
+    def _get_client_ip(self, request: Request) -> str:
+        """Resolve the client IP from proxy headers, once per request."""
+        ip = getattr(request.state, "_rl_ip", None)
+        if ip is not None:
+            return ip
+        
+        # Get IP address from various headers
+        headers = request.headers
+        client_host = request.client.host if request.client else "unknown"
+        ip = (
+            headers.get("cf-connecting-ip") or  # Cloudflare
+            headers.get("x-forwarded-for", "").split(",")[0].strip() or
+            headers.get("x-real-ip") or
+            client_host
+        )
+        request.state._rl_ip = ip
+        return ip
+    
     def _get_client_identifier(self, request: Request, user_id: Optional[int] = None) -> str:
         """Generate unique identifier for rate limiting."""
         if user_id:
             return f"user:{user_id}"
         
-        # Get IP address from various headers
-        ip = (
-            request.headers.get("cf-connecting-ip") or  # Cloudflare
-            request.headers.get("x-forwarded-for", "").split(",")[0].strip() or
-            request.headers.get("x-real-ip") or
-            request.client.host if request.client else "unknown"
-        )
+        # Computed once per request
+        identifier = getattr(request.state, "_rl_id", None)
+        if identifier is not None:
+            return identifier
         
-        # Include user agent hash for additional uniqueness
+        # Include user agent hash for additional uniqueness; crc32 rather than
+        # hash() so every worker process puts a client in the same bucket
         user_agent = request.headers.get("user-agent", "")[:50]
-        return f"ip:{ip}:ua:{hash(user_agent) % 10000}"
+        ua_hash = zlib.crc32(user_agent.encode("utf-8", "ignore")) % 10000
+        identifier = f"ip:{self._get_client_ip(request)}:ua:{ua_hash}"
+        request.state._rl_id = identifier
+        return identifier
     
     def _get_rate_limit_key(self, identifier: str, action: str) -> str:
         """Generate Redis key for rate limiting."""
@@ -80,102 +154,102 @@ class EnhancedRateLimiter:
         """Generate Redis key for violation tracking."""
         return f"violations:{identifier}"
     
-    def _get_current_usage(self, key: str, window: int) -> Tuple[int, int]:
-        """Get current usage count and window start time."""
-        now = int(time.time())
-        window_start = now - (now % window)
+    def _check_usage(
+        self,
+        key: str,
+        violation_key: str,
+        now: float,
+        window: int,
+        limit: int,
+        burst: int
+    ) -> Tuple[bool, int, int, int]:
+        """
+        Check and record a request against its sliding windows.
         
+        Returns (allowed, count, burst_count, violations); violations is the
+        updated count when the request is denied and 0 when it is admitted.
+        """
         if self.redis_client:
             try:
-                # Use Redis sorted set for sliding window
-                pipe = self.redis_client.pipeline()
-                
-                # Remove old entries
-                pipe.zremrangebyscore(key, 0, now - window)
-                
-                # Count current entries
-                pipe.zcard(key)
-                
-                # Set expiration
-                pipe.expire(key, window)
-                
-                results = pipe.execute()
-                current_count = results[1]
-                
-                return current_count, window_start
+                return self._redis_check_usage(key, violation_key, now, window, limit, burst)
             except Exception as e:
-                print(f"Redis error in _get_current_usage: {e}")
-                return self._memory_get_usage(key, window)
-        else:
-            return self._memory_get_usage(key, window)
+                print(f"Redis error in _check_usage: {e}")
+        return self._memory_check_usage(key, violation_key, now, window, limit, burst)
     
-    def _memory_get_usage(self, key: str, window: int) -> Tuple[int, int]:
-        """Fallback in-memory usage tracking."""
-        now = int(time.time())
-        window_start = now - (now % window)
-        
-        if key not in self.memory_store:
-            self.memory_store[key] = []
-        
-        # Clean old entries
-        self.memory_store[key] = [
-            timestamp for timestamp in self.memory_store[key] 
-            if timestamp > now - window
-        ]
-        
-        return len(self.memory_store[key]), window_start
-    
-    def _record_request(self, key: str, window: int) -> None:
-        """Record a new request."""
-        now = int(time.time())
+    def _redis_check_usage(
+        self,
+        key: str,
+        violation_key: str,
+        now: float,
+        window: int,
+        limit: int,
+        burst: int
+    ) -> Tuple[bool, int, int, int]:
+        """Run the rate limit script, reloading it if Redis lost its cache."""
+        window_id = int(now // window)
+        burst_id = int(now // BURST_WINDOW)
+        keys = (
+            f"{key}:{window_id}",
+            f"{key}:{window_id - 1}",
+            f"{key}:burst:{burst_id}",
+            f"{key}:burst:{burst_id - 1}",
+            violation_key
+        )
+        args = (
+            window,
+            limit,
+            _previous_window_weight(now, window),
+            BURST_WINDOW,
+            burst,
+            _previous_window_weight(now, BURST_WINDOW),
+            VIOLATION_TTL
+        )
+        try:
+            if self._rate_limit_sha is None:
+                raise redis.exceptions.NoScriptError()
+            result = self.redis_client.evalsha(self._rate_limit_sha, len(keys), *keys, *args)
+        except redis.exceptions.NoScriptError:
+            result = self.redis_client.eval(RATE_LIMIT_LUA, len(keys), *keys, *args)
+            self._rate_limit_sha = self.redis_client.script_load(RATE_LIMIT_LUA)
         
-        if self.redis_client:
-            try:
-                pipe = self.redis_client.pipeline()
-                # Add current timestamp to sorted set
-                pipe.zadd(key, {str(now): now})
-                # Set expiration
-                pipe.expire(key, window)
-                pipe.execute()
-            except Exception as e:
-                print(f"Redis error in _record_request: {e}")
-                self._memory_record_request(key, now)
-        else:
-            self._memory_record_request(key, now)
+        allowed, count, burst_count, violations = (int(value) for value in result)
+        return bool(allowed), count, burst_count, violations
     
-    def _memory_record_request(self, key: str, timestamp: int) -> None:
-        """Fallback in-memory request recording."""
-        if key not in self.memory_store:
-            self.memory_store[key] = []
-        self.memory_store[key].append(timestamp)
+    def _memory_window_count(self, key: str, now: float, window: int) -> Tuple[int, Tuple[int, int, int]]:
+        """Weighted count for an in-memory (window_id, current, previous) counter."""
+        window_id = int(now // window)
+        stored_id, current, previous = self._window_counters.get(key, (window_id, 0, 0))
+        if stored_id != window_id:
+            previous = current if stored_id == window_id - 1 else 0
+            current = 0
+        count = int(current + previous * _previous_window_weight(now, window))
+        return count, (window_id, current, previous)
     
-    def _get_violation_count(self, identifier: str) -> int:
-        """Get current violation count for progressive penalties."""
-        violation_key = self._get_violation_key(identifier)
+    def _memory_check_usage(
+        self,
+        key: str,
+        violation_key: str,
+        now: float,
+        window: int,
+        limit: int,
+        burst: int
+    ) -> Tuple[bool, int, int, int]:
+        """Fallback in-memory equivalent of RATE_LIMIT_LUA."""
+        burst_key = f"{key}:burst"
+        count, counter = self._memory_window_count(key, now, window)
+        burst_count, burst_counter = self._memory_window_count(burst_key, now, BURST_WINDOW)
         
-        if self.redis_client:
-            try:
-                count = self.redis_client.get(violation_key)
-                return int(count) if count else 0
-            except Exception:
-                return 0
-        else:
-            return self.memory_store.get(violation_key, 0)
-    
-    def _record_violation(self, identifier: str) -> None:
-        """Record a rate limit violation for progressive penalties."""
-        violation_key = self._get_violation_key(identifier)
+        if count >= limit or burst_count >= burst:
+            violations, expires_at = self._violation_counts.get(violation_key, (0, now))
+            violations = violations + 1 if expires_at > now else 1
+            self._violation_counts[violation_key] = (violations, now + VIOLATION_TTL)
+            return False, count, burst_count, violations
         
-        if self.redis_client:
-            try:
-                pipe = self.redis_client.pipeline()
-                pipe.incr(violation_key)
-                pipe.expire(violation_key, 3600)  # Reset violations after 1 hour
-                pipe.execute()
-            except Exception:
-                pass
-        else:
-            self.memory_store[violation_key] = self.memory_store.get(violation_key, 0) + 1
+        window_id, current, previous = counter
+        self._window_counters[key] = (window_id, current + 1, previous)
+        window_id, current, previous = burst_counter
+        self._window_counters[burst_key] = (window_id, current + 1, previous)
+        return True, count, burst_count, 0
     
     def _calculate_penalty_delay(self, violation_count: int) -> int:
         """Calculate delay based on violation count."""
@@ -197,41 +271,30 @@ class EnhancedRateLimiter:
         rate_limit_config = self.rate_limits.get(action, self.rate_limits["default"])
         
         key = self._get_rate_limit_key(identifier, action)
+        violation_key = self._get_violation_key(identifier)
         window = rate_limit_config["window"]
         limit = rate_limit_config["requests"]
         burst = rate_limit_config["burst"]
         
-        current_count, window_start = self._get_current_usage(key, window)
+        now = time.time()
+        window_start = int(now // window) * window
         
-        # Check for burst limit (short-term spike protection)
-        recent_requests = 0
-        if self.redis_client:
-            try:
-                now = int(time.time())
-                recent_requests = self.redis_client.zcount(key, now - 60, now)
-            except Exception:
-                recent_requests = 0
-        
-        # Check violations and calculate penalty
-        violation_count = self._get_violation_count(identifier)
-        penalty_delay = self._calculate_penalty_delay(violation_count)
-        
-        # Rate limit checks
-        rate_limited = False
-        reason = ""
-        
-        if current_count >= limit:
-            rate_limited = True
-            reason = f"Rate limit exceeded: {current_count}/{limit} requests per {window}s"
-        elif recent_requests >= burst:
-            rate_limited = True
-            reason = f"Burst limit exceeded: {recent_requests}/{burst} requests per minute"
+        allowed, current_count, recent_requests, violations = self._check_usage(
+            key, violation_key, now, window, limit, burst
+        )
         
-        if rate_limited:
-            self._record_violation(identifier)
+        if not allowed:
+            # Penalty is based on the violations recorded before this one
+            violation_count = violations - 1
+            penalty_delay = self._calculate_penalty_delay(violation_count)
+            
+            if current_count >= limit:
+                reason = f"Rate limit exceeded: {current_count}/{limit} requests per {window}s"
+            else:
+                reason = f"Burst limit exceeded: {recent_requests}/{burst} requests per minute"
             
             # Log security event
-            await self._log_rate_limit_violation(request, action, identifier, {
+            await self._log_rate_limit_violation(request, action, identifier, self._get_client_ip(request), now, {
                 "current_count": current_count,
                 "limit": limit,
                 "window": window,
@@ -255,9 +318,6 @@ class EnhancedRateLimiter:
                 }
             )
         
-        # Record successful request
-        self._record_request(key, window)
-        
         return {
             "allowed": True,
             "current_count": current_count + 1,
@@ -272,27 +332,42 @@ class EnhancedRateLimiter:
         request: Request, 
         action: str, 
         identifier: str, 
+        ip: str,
+        now: float,
         details: Dict[str, Any]
     ) -> None:
-        """Log rate limit violations for security monitoring."""
+        """Queue a rate limit violation for the background logger."""
         try:
             log_data = {
-                "timestamp": datetime.utcnow().isoformat(),
+                "timestamp": now,
                 "event_type": "rate_limit_violation",
                 "action": action,
                 "identifier": identifier,
-                "ip_address": self._get_client_identifier(request).split(":")[1],
+                "ip_address": ip,
                 "user_agent": request.headers.get("user-agent", "")[:200],
                 "path": str(request.url.path),
                 "method": request.method,
                 "details": details
             }
             
-            # Log to file or external service
-            print(f"🚨 Rate Limit Violation: {json.dumps(log_data)}")
+            if self._log_consumer is None or self._log_consumer.done():
+                self._log_queue = asyncio.Queue(maxsize=VIOLATION_LOG_QUEUE_SIZE)
+                self._log_consumer = asyncio.create_task(self._write_violation_logs(self._log_queue))
+            self._log_queue.put_nowait(log_data)
             
+        except asyncio.QueueFull:
+            pass  # Under a flood, shed log entries rather than slow down responses
         except Exception as e:
             print(f"Error logging rate limit violation: {e}")
+    
+    async def _write_violation_logs(self, queue: asyncio.Queue) -> None:
+        """Serialize and log queued violations off the request path."""
+        while True:
+            log_data = await queue.get()
+            try:
+                logger.warning("🚨 Rate Limit Violation: %s", orjson.dumps(log_data).decode())
+            except Exception as e:
+                print(f"Error logging rate limit violation: {e}")
 
 
 # Global rate limiter instance
@@ -4,32 +4,104 @@ Protects against malicious users, bots, and abuse in the BIN/card generation nic
 """
 
 import hashlib
-import json
+import logging
 import time
 from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Optional, Tuple
 from fastapi import Request
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_, func
-import geoip2.database
-import geoip2.errors
 import re
 import asyncio
 from collections import defaultdict, deque
 import os
+import orjson
+import redis
 
-from app.database import get_redis
+from app.database import get_redis, get_async_redis, reset_async_redis_on_error
+from app.utils.cache import async_ttl_cache
 from app.models import User, UsageLog, SecurityEvent, ActionType
 
+logger = logging.getLogger(__name__)
+
+# Most recent security event keys, newest first, capped at RECENT_EVENTS_LIMIT
+RECENT_EVENTS_KEY = "security:events:recent"
+RECENT_EVENTS_LIMIT = 100
+
+# Currently blocked IPs, scored by block expiry (epoch seconds), so active
+# blocks can be counted without scanning the keyspace
+BLOCKED_IPS_KEY = "security:blocked_ips"
+
+# Daily security counters read by the health endpoints
+BLOCKED_REQUESTS_KEY = "security:blocked_requests_today"
+HIGH_RISK_REQUESTS_KEY = "security:high_risk_requests_today"
+SECURITY_COUNTER_TTL = 172800  # 2 days
+
+# Security events are queued by request handlers and written to Redis in
+# batches every SECURITY_EVENT_FLUSH_SECONDS; new ones are dropped while the
+# queue is full
+SECURITY_EVENT_FLUSH_SECONDS = 0.05
+SECURITY_EVENT_QUEUE_SIZE = 10000
+
+# IP -> country is effectively static, so GeoIP lookups are cached in-process
+GEOIP_CACHE_SECONDS = 3600
+GEOIP_CACHE_SIZE = 100_000
+
+# (day ordinal, key) for today's security-event counter, rebuilt once per day
+_today_events_key: Tuple[int, str] = (0, "")
+
+def today_events_key() -> str:
+    """Redis key of today's (UTC) security-event counter"""
+    global _today_events_key
+    now = datetime.now(timezone.utc)
+    day = now.toordinal()
+    if _today_events_key[0] != day:
+        _today_events_key = (day, f"security:events:count:{now.strftime('%Y-%m-%d')}")
+    return _today_events_key[1]
+
+def _compile_alternation(patterns: List[str]) -> Tuple["re.Pattern[str]", Dict[str, str]]:
+    """Fuse patterns into one case-insensitive regex; returns it with a group name -> pattern map"""
+    names = {f"p{i}": pattern for i, pattern in enumerate(patterns)}
+    regex = re.compile(
+        "|".join(f"(?P<{name}>{pattern})" for name, pattern in names.items()),
+        re.IGNORECASE
+    )
+    return regex, names
+
 class SecurityService:
     """Advanced security and fraud detection for BIN/card services"""
     
     def __init__(self):
         self.redis = get_redis()
         self.suspicious_patterns = self._load_suspicious_patterns()
+        # One pass over the UA / IP instead of one regex search per pattern
+        self._ua_re, self._ua_patterns = _compile_alternation(self.suspicious_patterns["user_agents"])
+        self._ip_re, self._ip_patterns = _compile_alternation(self.suspicious_patterns["suspicious_ips"])
         self.blocked_countries = set(os.getenv("BLOCKED_COUNTRIES", "").split(","))
         self.vpn_detection_enabled = bool(os.getenv("VPN_DETECTION_ENABLED", "true").lower() == "true")
-        
+        self._geo_reader = self._open_geoip_reader(os.getenv("GEOIP_DB_PATH", ""))
+        # Created on first use, once an event loop is running
+        self._event_queue: Optional[asyncio.Queue] = None
+        self._event_flusher: Optional[asyncio.Task] = None
+        
+    def _open_geoip_reader(self, path: str):
+        """Open the GeoIP2 country database once; it is mmap-backed and thread-safe
+        
+        geoip2 is optional and only imported when GEOIP_DB_PATH is set.
+        """
+        if not path:
+            return None
+        try:
+            import geoip2.database
+        except ImportError:
+            logger.warning("GEOIP_DB_PATH is set but geoip2 is not installed; GeoIP lookups disabled")
+            return None
+        try:
+            return geoip2.database.Reader(path)
+        except Exception as e:
+            logger.warning(f"GeoIP database unavailable ({path}): {e}")
+            return None
+    
     def _load_suspicious_patterns(self) -> Dict[str, List[str]]:
         """Load patterns that indicate malicious behavior"""
         return {
@@ -56,9 +128,16 @@ class SecurityService:
         
         risk_score = 0
         risk_factors = []
+        now = datetime.now(timezone.utc)
+        
+        blocked, ip_requests, user_requests, failed_logins = await self._fetch_risk_counters(client_ip, user)
+        is_vpn = (
+            not blocked and self.vpn_detection_enabled and
+            await self._is_vpn_or_proxy(client_ip)
+        )
         
         # 1. IP-based analysis
-        ip_risk = await self._analyze_ip_risk(client_ip)
+        ip_risk = self._analyze_ip_risk(client_ip, blocked, ip_requests, is_vpn)
         risk_score += ip_risk["score"]
         risk_factors.extend(ip_risk["factors"])
         
@@ -68,13 +147,13 @@ class SecurityService:
         risk_factors.extend(ua_risk["factors"])
         
         # 3. Rate limiting analysis
-        rate_risk = await self._analyze_rate_patterns(client_ip, user)
+        rate_risk = self._analyze_rate_patterns(ip_requests, user_requests)
         risk_score += rate_risk["score"]
         risk_factors.extend(rate_risk["factors"])
         
         # 4. Behavioral analysis (if user exists)
         if user:
-            behavior_risk = await self._analyze_user_behavior(user)
+            behavior_risk = self._analyze_user_behavior(user, failed_logins, now)
             risk_score += behavior_risk["score"] 
             risk_factors.extend(behavior_risk["factors"])
         
@@ -94,25 +173,47 @@ class SecurityService:
             "requires_verification": risk_score >= 30
         }
     
-    async def _analyze_ip_risk(self, ip: str) -> Dict[str, any]:
+    async def _fetch_risk_counters(self, ip: str, user: Optional[User]) -> Tuple[bool, int, int, int]:
+        """Read blocklist status and request/login counters in a single round-trip
+        
+        Returns (blocked, ip_requests, user_requests, failed_logins); the user
+        counters are 0 when there is no user, and everything is zero when
+        Redis is unreachable.
+        """
+        try:
+            pipe = (await get_async_redis()).pipeline()
+            pipe.get(f"security:blocked_ip:{ip}")
+            pipe.get(f"security:ip_requests:{ip}")
+            if user:
+                pipe.get(f"security:user_requests:{user.id}")
+                pipe.get(f"security:failed_logins:{user.id}")
+            results = await pipe.execute()
+        except redis.RedisError as e:
+            reset_async_redis_on_error(e)
+            return False, 0, 0, 0
+        
+        blocked, ip_requests, *user_counts = results
+        user_requests, failed_logins = (int(count or 0) for count in user_counts) if user else (0, 0)
+        return bool(blocked), int(ip_requests or 0), user_requests, failed_logins
+    
+    def _analyze_ip_risk(self, ip: str, blocked: bool, request_rate: int, is_vpn: bool) -> Dict[str, any]:
         """Analyze IP-based risk factors"""
         risk_score = 0
         factors = []
         
         # Check if IP is in our blocklist
-        if await self._is_blocked_ip(ip):
+        if blocked:
             risk_score += 100
             factors.append("IP_BLOCKED")
             return {"score": risk_score, "factors": factors}
         
-        # Check for suspicious IP patterns
-        for pattern in self.suspicious_patterns["suspicious_ips"]:
-            if re.match(pattern, ip):
-                risk_score += 30
-                factors.append(f"SUSPICIOUS_IP_PATTERN_{pattern}")
+        # Check for suspicious IP patterns (all anchored, so at most one matches)
+        match = self._ip_re.match(ip)
+        if match:
+            risk_score += 30
+            factors.append(f"SUSPICIOUS_IP_PATTERN_{self._ip_patterns[match.lastgroup]}")
         
         # Check for high request rate from this IP
-        request_rate = await self._get_ip_request_rate(ip)
         if request_rate > 100:  # More than 100 requests per hour
             risk_score += 40
             factors.append("HIGH_REQUEST_RATE")
@@ -120,15 +221,14 @@ class SecurityService:
             risk_score += 20
             factors.append("ELEVATED_REQUEST_RATE")
         
-        # Check for VPN/Proxy (if detection enabled)
-        if self.vpn_detection_enabled:
-            if await self._is_vpn_or_proxy(ip):
-                risk_score += 25
-                factors.append("VPN_OR_PROXY")
+        # Check for VPN/Proxy (only looked up if detection enabled)
+        if is_vpn:
+            risk_score += 25
+            factors.append("VPN_OR_PROXY")
         
         return {"score": risk_score, "factors": factors}
     
-    async def _analyze_user_agent(self, user_agent: str) -> Dict[str, any]:
+    def _analyze_user_agent(self, user_agent: str) -> Dict[str, any]:
         """Analyze user agent for bot/automation signs"""
         risk_score = 0
         factors = []
@@ -140,9 +240,10 @@ class SecurityService:
         
         user_agent_lower = user_agent.lower()
         
-        # Check for suspicious user agent patterns
-        for pattern in self.suspicious_patterns["user_agents"]:
-            if re.search(pattern, user_agent_lower):
+        # Check for suspicious user agent patterns, each counted once
+        matched = {match.lastgroup for match in self._ua_re.finditer(user_agent)}
+        for name, pattern in self._ua_patterns.items():
+            if name in matched:
                 risk_score += 40
                 factors.append(f"SUSPICIOUS_USER_AGENT_{pattern.upper()}")
         
@@ -158,16 +259,12 @@ class SecurityService:
         
         return {"score": risk_score, "factors": factors}
     
-    async def _analyze_rate_patterns(self, ip: str, user: Optional[User]) -> Dict[str, any]:
+    def _analyze_rate_patterns(self, ip_requests: int, user_requests: int) -> Dict[str, any]:
         """Analyze request rate patterns for abuse"""
         risk_score = 0
         factors = []
         
         # Check IP-based rate patterns
-        ip_key = f"security:ip_requests:{ip}"
-        ip_requests = await self.redis.get(ip_key) or 0
-        ip_requests = int(ip_requests)
-        
         if ip_requests > 200:  # More than 200 requests per hour
             risk_score += 50
             factors.append("EXTREME_IP_RATE")
@@ -175,25 +272,20 @@ class SecurityService:
             risk_score += 30
             factors.append("HIGH_IP_RATE")
         
-        # Check user-based patterns (if user exists)
-        if user:
-            user_key = f"security:user_requests:{user.id}"
-            user_requests = await self.redis.get(user_key) or 0
-            user_requests = int(user_requests)
-            
-            if user_requests > 500:  # Premium users might have higher limits
-                risk_score += 25
-                factors.append("HIGH_USER_RATE")
+        # Check user-based patterns (0 when there is no user)
+        if user_requests > 500:  # Premium users might have higher limits
+            risk_score += 25
+            factors.append("HIGH_USER_RATE")
         
         return {"score": risk_score, "factors": factors}
     
-    async def _analyze_user_behavior(self, user: User) -> Dict[str, any]:
+    def _analyze_user_behavior(self, user: User, failed_logins: int, now: datetime) -> Dict[str, any]:
         """Analyze user behavioral patterns"""
         risk_score = 0
         factors = []
         
         # New account risk (accounts < 1 day old are higher risk)
-        account_age = datetime.now(timezone.utc) - user.created_at
+        account_age = now - user.created_at
         if account_age < timedelta(hours=1):
             risk_score += 30
             factors.append("VERY_NEW_ACCOUNT")
@@ -208,7 +300,6 @@ class SecurityService:
             factors.append("TEMPORARY_EMAIL")
         
         # Pattern: Many failed login attempts
-        failed_logins = await self._get_failed_login_count(user.id)
         if failed_logins > 10:
             risk_score += 30
             factors.append("EXCESSIVE_FAILED_LOGINS")
@@ -245,27 +336,72 @@ class SecurityService:
         return {"score": risk_score, "factors": factors}
     
     async def log_security_event(self, event_type: str, risk_analysis: Dict, user_id: Optional[int] = None):
-        """Log security events for monitoring and analysis"""
+        """Queue a security event for the background Redis writer"""
+        now = time.time()
         event_data = {
             "event_type": event_type,
             "risk_score": risk_analysis["risk_score"],
-            "risk_level": risk_analysis["risk_level"],
-            "risk_factors": risk_analysis["risk_factors"],
-            "client_ip": risk_analysis["client_ip"],
+            # Error and block payloads may not carry the full analysis
+            "risk_level": risk_analysis.get("risk_level") or self._calculate_risk_level(risk_analysis["risk_score"]),
+            "risk_factors": risk_analysis.get("risk_factors", []),
+            "client_ip": risk_analysis.get("client_ip"),
             "user_agent": risk_analysis.get("user_agent", ""),
-            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "timestamp": datetime.fromtimestamp(now, timezone.utc).isoformat(),
             "user_id": user_id
         }
         
         # Store in Redis for real-time analysis
-        event_key = f"security:events:{int(time.time())}"
-        await self.redis.setex(event_key, 86400, json.dumps(event_data))  # Keep for 24 hours
+        event_key = f"security:events:{int(now)}"
+        if self._event_flusher is None or self._event_flusher.done():
+            self._event_queue = asyncio.Queue(maxsize=SECURITY_EVENT_QUEUE_SIZE)
+            self._event_flusher = asyncio.create_task(self._flush_security_events(self._event_queue))
+        try:
+            self._event_queue.put_nowait((event_key, event_data, bool(risk_analysis.get("should_block"))))
+        except asyncio.QueueFull:
+            pass  # Under a flood, shed events rather than slow down responses
         
         # Also log high-risk events to database
         if risk_analysis["risk_score"] >= 50:
             # You'd implement database logging here
             pass
     
+    async def _flush_security_events(self, queue: asyncio.Queue):
+        """Write queued security events to Redis, one pipeline per batch"""
+        while True:
+            batch = [await queue.get()]
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            
+            try:
+                pipe = (await get_async_redis()).pipeline()
+                for event_key, event_data, _ in batch:
+                    pipe.setex(event_key, 86400, orjson.dumps(event_data))  # Keep for 24 hours
+                pipe.lpush(RECENT_EVENTS_KEY, *(event_key for event_key, _, _ in batch))
+                pipe.ltrim(RECENT_EVENTS_KEY, 0, RECENT_EVENTS_LIMIT - 1)
+                self._queue_counter_increments(
+                    pipe,
+                    events=len(batch),
+                    blocked=sum(blocked for _, _, blocked in batch),
+                    high_risk=sum(event_data["risk_score"] >= 50 for _, event_data, _ in batch)
+                )
+                await pipe.execute()
+            except Exception as e:
+                reset_async_redis_on_error(e)
+                logger.error(f"Failed to write {len(batch)} security events: {e}")
+            
+            await asyncio.sleep(SECURITY_EVENT_FLUSH_SECONDS)
+    
+    def _queue_counter_increments(self, pipe, events: int, blocked: int, high_risk: int):
+        """Queue INCRBY + EXPIRE for each non-zero security counter on a pipeline"""
+        for key, amount in (
+            (today_events_key(), events),
+            (BLOCKED_REQUESTS_KEY, blocked),
+            (HIGH_RISK_REQUESTS_KEY, high_risk)
+        ):
+            if amount:
+                pipe.incrby(key, amount)
+                pipe.expire(key, SECURITY_COUNTER_TTL)
+    
     async def should_block_request(self, risk_analysis: Dict) -> bool:
         """Determine if request should be blocked"""
         return risk_analysis["should_block"] or risk_analysis["risk_score"] >= 80
@@ -273,21 +409,32 @@ class SecurityService:
     async def increment_ip_requests(self, ip: str):
         """Increment request counter for IP"""
         key = f"security:ip_requests:{ip}"
-        await self.redis.incr(key)
-        await self.redis.expire(key, 3600)  # 1 hour expiry
+        try:
+            pipe = (await get_async_redis()).pipeline()
+            pipe.incr(key)
+            pipe.expire(key, 3600)  # 1 hour expiry
+            await pipe.execute()
+        except redis.RedisError as e:
+            reset_async_redis_on_error(e)
     
     def _get_client_ip(self, request: Request) -> str:
         """Extract real client IP (considering proxies)"""
+        client_ip = getattr(request.state, "_client_ip", None)
+        if client_ip is not None:
+            return client_ip
+        
         # Check various headers for real IP
         forwarded_for = request.headers.get("X-Forwarded-For")
         if forwarded_for:
-            return forwarded_for.split(",")[0].strip()
-        
-        real_ip = request.headers.get("X-Real-IP")
-        if real_ip:
-            return real_ip
+            client_ip = forwarded_for.split(",")[0].strip()
+        else:
+            client_ip = (
+                request.headers.get("X-Real-IP") or
+                (request.client.host if request.client else "unknown")
+            )
         
-        return request.client.host
+        request.state._client_ip = client_ip
+        return client_ip
     
     def _calculate_risk_level(self, score: int) -> str:
         """Convert numeric score to risk level"""
@@ -302,31 +449,42 @@ class SecurityService:
         else:
             return "MINIMAL"
     
-    # Helper methods (you'd implement these based on your infrastructure)
-    async def _is_blocked_ip(self, ip: str) -> bool:
-        """Check if IP is in blocklist"""
-        blocked = await self.redis.get(f"security:blocked_ip:{ip}")
-        return bool(blocked)
+    async def block_ip(self, ip: str, duration_seconds: int = 3600):
+        """Block an IP and track it in the blocked-IP index"""
+        now = time.time()
+        pipe = (await get_async_redis()).pipeline()
+        pipe.setex(f"security:blocked_ip:{ip}", duration_seconds, 1)
+        pipe.zadd(BLOCKED_IPS_KEY, {ip: now + duration_seconds})
+        pipe.zremrangebyscore(BLOCKED_IPS_KEY, 0, now)
+        await pipe.execute()
     
-    async def _get_ip_request_rate(self, ip: str) -> int:
-        """Get request rate for IP"""
-        count = await self.redis.get(f"security:ip_requests:{ip}")
-        return int(count) if count else 0
+    async def count_blocked_ips(self, redis=None) -> int:
+        """Count IPs whose block has not yet expired"""
+        redis = redis or await get_async_redis()
+        return await redis.zcount(BLOCKED_IPS_KEY, time.time(), "+inf")
     
+    # Helper methods (you'd implement these based on your infrastructure)
     async def _is_vpn_or_proxy(self, ip: str) -> bool:
         """Check if IP is VPN/proxy (implement with external service)"""
         # You'd integrate with a VPN detection service here
         return False
     
     async def _get_country_from_ip(self, ip: str) -> str:
-        """Get country code from IP (implement with GeoIP)"""
-        # You'd implement GeoIP lookup here
-        return "XX"
+        """Get country code from IP, or "XX" if unknown or GeoIP is not configured"""
+        if self._geo_reader is None:
+            return "XX"
+        return await self._lookup_country(ip)
     
-    async def _get_failed_login_count(self, user_id: int) -> int:
-        """Get failed login attempts for user"""
-        count = await self.redis.get(f"security:failed_logins:{user_id}")
-        return int(count) if count else 0
+    @async_ttl_cache(GEOIP_CACHE_SECONDS, maxsize=GEOIP_CACHE_SIZE)
+    async def _lookup_country(self, ip: str) -> str:
+        """Resolve an IP in the GeoIP database off the event loop (cached per IP)"""
+        import geoip2.errors  # Importable whenever a reader was opened
+        
+        try:
+            response = await asyncio.to_thread(self._geo_reader.country, ip)
+        except (geoip2.errors.AddressNotFoundError, ValueError):
+            return "XX"
+        return response.country.iso_code or "XX"
 
 # Global instance
 security_service = SecurityService()
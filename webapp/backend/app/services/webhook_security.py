@@ -15,6 +15,7 @@ import logging
 from app.database import get_db, get_redis
 from app.models import User, Subscription, SubscriptionStatus, SecurityEvent
 from app.services.security_service import security_service
+from app.utils.signatures import verify_hmac_signature
 import os
 
 logger = logging.getLogger(__name__)
@@ -67,13 +68,7 @@ class WebhookSecurityService:
         if not signature:
             return False
         
-        expected_signature = hmac.new(
-            secret.encode('utf-8'),
-            payload,
-            hashlib.sha256
-        ).hexdigest()
-        
-        return hmac.compare_digest(signature, expected_signature)
+        return verify_hmac_signature(secret.encode('utf-8'), payload, signature)
     
     def _validate_nowpayments_signature(self, request: Request, payload: bytes, secret: str) -> bool:
         """Validate NOWPayments webhook signature"""
@@ -82,13 +77,7 @@ class WebhookSecurityService:
             return False
         
         # NOWPayments uses HMAC-SHA512
-        expected_signature = hmac.new(
-            secret.encode('utf-8'),
-            payload,
-            hashlib.sha512
-        ).hexdigest()
-        
-        return hmac.compare_digest(signature, expected_signature)
+        return verify_hmac_signature(secret.encode('utf-8'), payload, signature, hashlib.sha512)
     
     def _validate_coingate_signature(self, request: Request, payload: bytes, secret: str) -> bool:
         """Validate CoinGate webhook signature"""
@@ -96,13 +85,7 @@ class WebhookSecurityService:
         if not signature:
             return False
         
-        expected_signature = hmac.new(
-            secret.encode('utf-8'),
-            payload,
-            hashlib.sha256
-        ).hexdigest()
-        
-        return hmac.compare_digest(signature, expected_signature)
+        return verify_hmac_signature(secret.encode('utf-8'), payload, signature)
     
     def _validate_cryptomus_signature(self, request: Request, payload: bytes, secret: str) -> bool:
         """Validate Cryptomus webhook signature"""
@@ -0,0 +1,92 @@
+"""
+In-memory response caching utilities for cheap, frequently polled endpoints
+"""
+from functools import wraps
+from typing import Any, Dict, Tuple
+import time
+
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel
+
+# Cached entries keyed by endpoint: (expiry, body, media_type)
+_response_cache: Dict[str, Tuple[float, bytes, str]] = {}
+
+def async_ttl_cache(seconds: int, maxsize: int = 256):
+    """
+    Memoize a coroutine's result per positional/keyword arguments for `seconds`.
+    
+    Falsy results (failed lookups) are not cached so the next call retries.
+    The oldest entry is evicted once `maxsize` keys are held. Every caller
+    gets the same cached object, so treat results as read-only (or copy them
+    in a public wrapper) if anything might mutate them. The wrapper
+    exposes `cache_clear()` and `cache_invalidate(*args, **kwargs)`, which
+    drops the entry for one set of arguments.
+    """
+    def decorator(func):
+        cache: Dict[Tuple, Tuple[float, Any]] = {}
+        
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            now = time.monotonic()
+            entry = cache.get(key)
+            if entry and entry[0] > now:
+                return entry[1]
+            
+            result = await func(*args, **kwargs)
+            if result:
+                if len(cache) >= maxsize and key not in cache:
+                    cache.pop(next(iter(cache)))
+                cache[key] = (now + seconds, result)
+            return result
+        
+        def cache_invalidate(*args, **kwargs):
+            cache.pop((args, tuple(sorted(kwargs.items()))), None)
+        
+        wrapper.cache_clear = cache.clear
+        wrapper.cache_invalidate = cache_invalidate
+        return wrapper
+    return decorator
+
+def ttl_cache(seconds: int):
+    """
+    Cache an endpoint's successful response in memory for `seconds`.
+    
+    Responses carry an `X-Cache: HIT/MISS` header and a matching
+    `Cache-Control: public, max-age=N` so upstream load balancers can cache too.
+    Arguments are not part of the cache key, so only decorate endpoints whose
+    output does not depend on request parameters.
+    """
+    def decorator(func):
+        key = f"{func.__module__}.{func.__qualname__}"
+        cache_control = f"public, max-age={seconds}"
+        
+        @wraps(func)
+        async def wrapper(*args, **kwargs) -> Response:
+            now = time.monotonic()
+            entry = _response_cache.get(key)
+            
+            if entry and entry[0] > now:
+                _, body, media_type = entry
+                cache_status = "HIT"
+            else:
+                result: Any = await func(*args, **kwargs)
+                if isinstance(result, BaseModel):
+                    result = result.model_dump(mode="json")
+                if not isinstance(result, Response):
+                    result = ORJSONResponse(content=result)
+                if result.status_code != 200:
+                    return result
+                
+                body, media_type = result.body, result.media_type
+                _response_cache[key] = (now + seconds, body, media_type)
+                cache_status = "MISS"
+            
+            return Response(
+                content=body,
+                media_type=media_type,
+                headers={"X-Cache": cache_status, "Cache-Control": cache_control}
+            )
+        
+        return wrapper
+    return decorator
@@ -2,11 +2,15 @@
 IP-based rate limiting utilities for anonymous users
 """
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Optional
+from typing import Dict, Iterable, Optional
 import redis
 import json
+import time
 from app.database import get_redis
 
+# Windows (in seconds) tracked by the sliding-window activity log
+DEFAULT_WINDOWS = (5 * 60, 86400)
+
 class IPRateLimit:
     def __init__(self, redis_client: Optional[redis.Redis] = None):
         self.redis_client = redis_client or get_redis()
@@ -89,14 +93,50 @@ class IPRateLimit:
                 else:
                     usage['count'] += 1
             
-            # Store updated usage with expiration
+            # Store updated usage and record the hit in the sliding-window log
             expire_seconds = int(window_hours * 3600)
-            self.redis_client.setex(key, expire_seconds, json.dumps(usage))
+            now = time.time()
+            window_key = f"ip_window:{ip_address}:{action}"
+            pipe = self.redis_client.pipeline()
+            pipe.setex(key, expire_seconds, json.dumps(usage))
+            pipe.zadd(window_key, {f"{now:.6f}": now})
+            pipe.expire(window_key, max(expire_seconds, max(DEFAULT_WINDOWS)))
+            pipe.execute()
             
         except Exception as e:
             # If Redis fails, continue silently
             print(f"Redis error in IP usage increment: {e}")
     
+    def get_window_counts(self, ip_address: str, action: str, windows: Iterable[int] = DEFAULT_WINDOWS) -> Dict[int, int]:
+        """
+        Count recent actions for an IP over several sliding windows in one round-trip.
+        
+        Args:
+            ip_address: The client IP address
+            action: The action being tracked (e.g., 'crypto_check')
+            windows: Window sizes in seconds
+            
+        Returns:
+            Dict[int, int]: Mapping of window size to number of actions in that window
+        """
+        windows = tuple(windows)
+        try:
+            window_key = f"ip_window:{ip_address}:{action}"
+            now = time.time()
+            
+            pipe = self.redis_client.pipeline()
+            pipe.zremrangebyscore(window_key, 0, now - max(windows))
+            for window in windows:
+                pipe.zcount(window_key, now - window, "+inf")
+            results = pipe.execute()
+            
+            return dict(zip(windows, (int(count) for count in results[1:])))
+            
+        except Exception as e:
+            # If Redis fails, report no activity (fail open)
+            print(f"Redis error getting IP window counts: {e}")
+            return {window: 0 for window in windows}
+    
     def get_ip_usage_info(self, ip_address: str, action: str) -> Dict:
         """
         Get current usage information for an IP address.
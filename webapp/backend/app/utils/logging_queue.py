@@ -0,0 +1,41 @@
+"""
+Queue-backed logging so request handlers never block on log I/O
+"""
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from typing import Optional
+import logging
+
+_listener: Optional[QueueListener] = None
+
+def configure_queue_logging() -> QueueListener:
+    """
+    Route root logging through a QueueHandler.
+    
+    Existing root handlers (or a stderr StreamHandler if there are none) are
+    moved onto a background QueueListener thread, so formatting and writes
+    happen off the event loop. Logger levels are left as configured. Safe to
+    call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    
+    root = logging.getLogger()
+    handlers = root.handlers[:] or [logging.StreamHandler()]
+    for handler in handlers:
+        root.removeHandler(handler)
+    
+    queue = SimpleQueue()
+    root.addHandler(QueueHandler(queue))
+    
+    _listener = QueueListener(queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+def stop_queue_logging():
+    """Flush and stop the background listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
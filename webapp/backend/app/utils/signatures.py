@@ -0,0 +1,48 @@
+"""
+HMAC signature verification shared by all webhook and IPN handlers
+"""
+from typing import Optional, Union
+import hashlib
+import hmac
+
+def _decode_signature(provided: Union[str, bytes, None]) -> Optional[bytes]:
+    """Decode a hex signature, or return None if it is missing or malformed."""
+    try:
+        if isinstance(provided, bytes):
+            provided = provided.decode("ascii")
+        if not isinstance(provided, str):
+            return None
+        return bytes.fromhex(provided)
+    except ValueError:
+        return None
+
+def signature_matches(expected_digest: bytes, provided: Union[str, bytes, None]) -> bool:
+    """
+    Compare a raw digest against a hex-encoded signature in constant time.
+    
+    The signature is decoded once and must be exactly the digest length, so
+    malformed or truncated values fail without a variable-length comparison.
+    """
+    provided_digest = _decode_signature(provided)
+    if provided_digest is None or len(provided_digest) != len(expected_digest):
+        return False
+    return hmac.compare_digest(expected_digest, provided_digest)
+
+def verify_hmac_signature(
+    secret: bytes,
+    body: bytes,
+    provided: Union[str, bytes, None],
+    digestmod=hashlib.sha256
+) -> bool:
+    """
+    Verify a hex HMAC signature (SHA-256 by default) of body under secret.
+    
+    Missing, non-hex or wrong-length signatures are rejected before the body
+    is hashed; lengths are public, so this leaks nothing about the secret.
+    """
+    provided_digest = _decode_signature(provided)
+    mac = hmac.new(secret, digestmod=digestmod)
+    if provided_digest is None or len(provided_digest) != mac.digest_size:
+        return False
+    mac.update(body)
+    return hmac.compare_digest(mac.digest(), provided_digest)
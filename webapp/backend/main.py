@@ -1,6 +1,6 @@
 from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 import time
 import logging
@@ -81,6 +81,10 @@ else:
     from app.routes import health_enhanced  # Enhanced health monitoring
     from app.services.security_service import SecurityService
     from app.services.rate_limiter import rate_limiter
+    from app.utils.logging_queue import configure_queue_logging, stop_queue_logging
+
+    # Hand log formatting and I/O to a background thread
+    configure_queue_logging()
 
     # Initialize enhanced monitoring
     try:
@@ -98,9 +102,12 @@ else:
     app = FastAPI(
         title="Professional BIN Search & Card Testing API",
         description="Secure API with 458K+ BIN records, card generation, and crypto wallet checking",
-        version="2.0.0"
+        version="2.0.0",
+        default_response_class=ORJSONResponse
     )
 
+    app.add_event_handler("shutdown", stop_queue_logging)
+
     # Global exception handler
     @app.exception_handler(Exception)
     async def global_exception_handler(request: Request, exc: Exception):
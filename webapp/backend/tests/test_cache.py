@@ -0,0 +1,76 @@
+"""
+Tests for the in-memory async TTL cache
+"""
+import asyncio
+import os
+import sys
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.utils import cache
+from app.utils.cache import async_ttl_cache
+
+def make_cached(seconds=60, maxsize=256, result=lambda key: f"value-{key}"):
+    """Return a cached coroutine and the list of keys it was actually called with."""
+    calls = []
+    
+    @async_ttl_cache(seconds=seconds, maxsize=maxsize)
+    async def lookup(key):
+        calls.append(key)
+        return result(key)
+    
+    return lookup, calls
+
+class TestAsyncTtlCache:
+    """Test async_ttl_cache memoization"""
+    
+    def test_repeat_calls_hit_cache(self):
+        lookup, calls = make_cached()
+        assert asyncio.run(lookup(1)) == "value-1"
+        assert asyncio.run(lookup(1)) == "value-1"
+        assert asyncio.run(lookup(2)) == "value-2"
+        assert calls == [1, 2]
+    
+    def test_entries_expire(self):
+        lookup, calls = make_cached(seconds=5)
+        with patch.object(cache.time, "monotonic", return_value=100.0):
+            asyncio.run(lookup(1))
+        with patch.object(cache.time, "monotonic", return_value=104.0):
+            asyncio.run(lookup(1))
+        assert calls == [1]
+        with patch.object(cache.time, "monotonic", return_value=105.0):
+            asyncio.run(lookup(1))
+        assert calls == [1, 1]
+    
+    def test_falsy_results_not_cached(self):
+        lookup, calls = make_cached(result=lambda key: None)
+        assert asyncio.run(lookup(1)) is None
+        assert asyncio.run(lookup(1)) is None
+        assert calls == [1, 1]
+    
+    def test_oldest_entry_evicted_at_maxsize(self):
+        lookup, calls = make_cached(maxsize=2)
+        for key in (1, 2, 3):
+            asyncio.run(lookup(key))
+        asyncio.run(lookup(3))
+        asyncio.run(lookup(2))
+        assert calls == [1, 2, 3]
+        asyncio.run(lookup(1))
+        assert calls == [1, 2, 3, 1]
+    
+    def test_cache_invalidate_drops_one_entry(self):
+        lookup, calls = make_cached()
+        asyncio.run(lookup(1))
+        asyncio.run(lookup(2))
+        lookup.cache_invalidate(1)
+        asyncio.run(lookup(1))
+        asyncio.run(lookup(2))
+        assert calls == [1, 2, 1]
+    
+    def test_cache_clear(self):
+        lookup, calls = make_cached()
+        asyncio.run(lookup(1))
+        lookup.cache_clear()
+        asyncio.run(lookup(1))
+        assert calls == [1, 1]
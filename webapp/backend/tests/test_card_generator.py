@@ -0,0 +1,82 @@
+"""
+Tests for Luhn validation and card number generation
+"""
+import os
+import sys
+from unittest.mock import patch
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.services import card_generator
+from app.services.card_gen_native import NATIVE_AVAILABLE
+from app.services.card_generator import (
+    BinRecord,
+    create_card_number,
+    has_bad_triples,
+    luhn_check_digit,
+    luhn_checksum,
+)
+
+AMEX = BinRecord("378282", "AMERICAN EXPRESS", None, "CREDIT", None, "US", None, None, None)
+
+class TestLuhn:
+    """Test Luhn checksum and check digit"""
+    
+    @pytest.mark.parametrize("number", ["4111111111111111", "5555555555554444", "378282246310005", "79927398713"])
+    def test_known_valid_numbers(self, number):
+        assert luhn_checksum(number)
+    
+    @pytest.mark.parametrize("number", ["4111111111111112", "79927398710"])
+    def test_invalid_numbers(self, number):
+        assert not luhn_checksum(number)
+    
+    @pytest.mark.parametrize("partial", ["411111111111111", "7992739871", "37828224631000"])
+    def test_check_digit_completes_valid_number(self, partial):
+        assert luhn_checksum(partial + luhn_check_digit(partial))
+    
+    def test_check_digit_values(self):
+        assert luhn_check_digit("7992739871") == "3"
+        assert luhn_check_digit("411111111111111") == "1"
+
+class TestBadTriples:
+    """Test the identical/ascending/descending run filter"""
+    
+    @pytest.mark.parametrize("digits", [[1, 1, 1], [3, 4, 5], [7, 6, 5], [0, 2, 4, 5, 6]])
+    def test_runs_rejected(self, digits):
+        assert has_bad_triples(digits)
+    
+    @pytest.mark.parametrize("digits", [[1, 1, 2], [1, 3, 5], [9, 0, 1], []])
+    def test_other_digits_accepted(self, digits):
+        assert not has_bad_triples(digits)
+
+def assert_generated(number, prefix, length):
+    assert number.isdigit()
+    assert number.startswith(prefix)
+    assert len(number) == length
+    assert luhn_checksum(number)
+    body = [int(d) for d in number[len(prefix):-1]]
+    assert max(body.count(d) for d in set(body)) <= 2
+
+@pytest.fixture(params=[
+    pytest.param(True, marks=pytest.mark.skipif(not NATIVE_AVAILABLE, reason="numba not installed")),
+    False,
+], ids=["native", "python"])
+def generation_path(request):
+    with patch.object(card_generator, "NATIVE_AVAILABLE", request.param):
+        yield
+
+class TestCreateCardNumber:
+    """Test create_card_number on both the compiled and pure Python paths"""
+    
+    def test_default_length(self, generation_path):
+        for _ in range(50):
+            assert_generated(create_card_number("453211"), "453211", 16)
+    
+    def test_amex_length(self, generation_path):
+        for _ in range(50):
+            assert_generated(create_card_number("378282", AMEX), "378282", 15)
+    
+    def test_numbers_vary(self, generation_path):
+        assert len({create_card_number("453211") for _ in range(20)}) > 1
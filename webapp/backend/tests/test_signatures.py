@@ -0,0 +1,66 @@
+"""
+Tests for shared webhook HMAC signature verification
+"""
+import hashlib
+import hmac
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.utils.signatures import signature_matches, verify_hmac_signature
+
+SECRET = b"webhook-secret"
+BODY = b'{"payment_status": "finished"}'
+VALID = hmac.new(SECRET, BODY, hashlib.sha256).hexdigest()
+
+class TestVerifyHmacSignature:
+    """Test verify_hmac_signature"""
+    
+    def test_valid_signature(self):
+        assert verify_hmac_signature(SECRET, BODY, VALID)
+    
+    def test_uppercase_hex_accepted(self):
+        assert verify_hmac_signature(SECRET, BODY, VALID.upper())
+    
+    def test_bytes_signature_accepted(self):
+        assert verify_hmac_signature(SECRET, BODY, VALID.encode())
+    
+    def test_wrong_body_rejected(self):
+        assert not verify_hmac_signature(SECRET, BODY + b" ", VALID)
+    
+    def test_wrong_length_rejected(self):
+        assert not verify_hmac_signature(SECRET, BODY, VALID[:-2])
+        assert not verify_hmac_signature(SECRET, BODY, VALID + "00")
+    
+    def test_non_hex_rejected(self):
+        assert not verify_hmac_signature(SECRET, BODY, "z" * len(VALID))
+    
+    def test_missing_signature_rejected(self):
+        assert not verify_hmac_signature(SECRET, BODY, None)
+        assert not verify_hmac_signature(SECRET, BODY, "")
+    
+    def test_other_digest(self):
+        sha512 = hmac.new(SECRET, BODY, hashlib.sha512).hexdigest()
+        assert verify_hmac_signature(SECRET, BODY, sha512, digestmod=hashlib.sha512)
+        assert not verify_hmac_signature(SECRET, BODY, VALID, digestmod=hashlib.sha512)
+
+class TestSignatureMatches:
+    """Test signature_matches against a precomputed digest"""
+    
+    expected = hmac.new(SECRET, BODY, hashlib.sha256).digest()
+    
+    def test_valid_signature(self):
+        assert signature_matches(self.expected, VALID)
+    
+    def test_uppercase_hex_accepted(self):
+        assert signature_matches(self.expected, VALID.upper())
+    
+    def test_wrong_length_rejected(self):
+        assert not signature_matches(self.expected, VALID[:32])
+    
+    def test_non_hex_rejected(self):
+        assert not signature_matches(self.expected, "not-a-signature")
+    
+    def test_missing_signature_rejected(self):
+        assert not signature_matches(self.expected, None)